@@ -7,24 +7,252 @@ from org.xdi.model.custom.script.type.auth import PersonAuthenticationType
 from org.xdi.oxauth.service import UserService, AuthenticationService, AppInitializer
 from org.xdi.util import StringHelper
 from org.xdi.model.ldap import GluuLdapConfiguration
+from java.lang import System
 from java.util import Arrays
+from java.util.concurrent.atomic import AtomicLong, AtomicLongArray
 
 # from org.xdi.util import ArrayHelper
 # import java
 
+import bisect
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
 try:
     import json
 except ImportError:
     import simplejson as json
 
 
+class LockoutTracker:
+    """ Failed logins of each user in a sliding window of `window` seconds, kept in memory.
+        At most `maxSize` users are tracked, the users without a recent failure are dropped first. """
+
+    def __init__(self, window, maxSize, maxAttempts):
+        self.window = window * 1000
+        self.maxSize = maxSize
+        self.maxAttempts = maxAttempts
+        # Time of the failures of each user, the least recently failed first
+        self.failures = OrderedDict()
+        self.lock = threading.Lock()
+
+    def failure(self, key):
+        """ Record a failure and return the number of failures in the window. """
+        now = System.currentTimeMillis()
+
+        with self.lock:
+            attempts = [t for t in self.failures.pop(key, []) if now - t < self.window]
+
+            attempts.append(now)
+            self.failures[key] = attempts[-self.maxAttempts:]
+            self.expire(now)
+
+            return len(self.failures[key])
+
+    def reset(self, key):
+        with self.lock:
+            self.failures.pop(key, None)
+
+    def size(self):
+        return len(self.failures)
+
+    def expire(self, now):
+        while len(self.failures) > 0:
+            key = next(iter(self.failures))
+            if len(self.failures) <= self.maxSize and now - self.failures[key][-1] < self.window:
+                break
+            del self.failures[key]
+
+
+class RoutingCache:
+    """ LRU cache of the backend (configId and index of the login attribute) which last
+        authenticated each user, holding at most `maxSize` users for `ttl` seconds. """
+
+    def __init__(self, maxSize, ttl):
+        self.maxSize = maxSize
+        self.ttl = ttl * 1000
+        # Route and expiration time of each user, the least recently used first
+        self.routes = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = AtomicLong(0)
+        self.misses = AtomicLong(0)
+
+    def get(self, key):
+        now = System.currentTimeMillis()
+
+        with self.lock:
+            entry = self.routes.pop(key, None)
+            if entry is None or entry[1] <= now:
+                self.misses.incrementAndGet()
+                return None
+
+            self.routes[key] = entry
+            self.hits.incrementAndGet()
+            return entry[0]
+
+    def put(self, key, route):
+        now = System.currentTimeMillis()
+
+        with self.lock:
+            self.routes.pop(key, None)
+            self.routes[key] = (route, now + self.ttl)
+
+            while len(self.routes) > 0:
+                eldest = next(iter(self.routes))
+                if len(self.routes) <= self.maxSize and self.routes[eldest][1] > now:
+                    break
+                del self.routes[eldest]
+
+    def remove(self, key):
+        with self.lock:
+            self.routes.pop(key, None)
+
+    def stats(self):
+        hits = self.hits.get()
+        lookups = hits + self.misses.get()
+        hitRate = 0.0
+        if lookups > 0:
+            hitRate = 100.0 * hits / lookups
+
+        return "lookups: %d, hit rate: %.1f%%, size: %d" % (lookups, hitRate, len(self.routes))
+
+
+class Histogram:
+    """ Latency histogram in milliseconds, with fixed buckets. """
+
+    BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self):
+        self.buckets = AtomicLongArray(len(self.BOUNDS) + 1)
+        self.count = AtomicLong(0)
+        self.total = AtomicLong(0)
+        self.max = AtomicLong(0)
+
+    def add(self, value):
+        self.buckets.incrementAndGet(bisect.bisect_left(self.BOUNDS, value))
+        self.count.incrementAndGet()
+        self.total.addAndGet(value)
+
+        current = self.max.get()
+        while value > current and not self.max.compareAndSet(current, value):
+            current = self.max.get()
+
+    def percentile(self, percent):
+        """ Upper bound of the bucket holding the given percentile. """
+        threshold = self.count.get() * percent / 100.0
+        seen = 0
+        for idx in range(len(self.BOUNDS)):
+            seen += self.buckets.get(idx)
+            if seen > 0 and seen >= threshold:
+                return self.BOUNDS[idx]
+
+        return self.max.get()
+
+    def summary(self):
+        count = self.count.get()
+        average = 0.0
+        if count > 0:
+            average = float(self.total.get()) / count
+
+        return "count=%d avg=%.1fms p50<=%dms p95<=%dms max=%dms" % (
+            count, average, self.percentile(50), self.percentile(95), self.max.get())
+
+
+class Metrics:
+    """ Counters and latency histograms of each configId, dumped in the log, and appended to
+        `path` if it is set, every `interval` seconds. """
+
+    def __init__(self, interval, path=None):
+        self.interval = interval * 1000
+        self.path = path
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.nextDump = AtomicLong(System.currentTimeMillis() + self.interval)
+
+    def count(self, configId, name):
+        self.get(self.counters, (configId, name), AtomicLong).incrementAndGet()
+
+    def time(self, configId, name, startTime):
+        self.get(self.histograms, (configId, name), Histogram).add(
+            System.currentTimeMillis() - startTime)
+
+    def get(self, metrics, key, factory):
+        metric = metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = metrics.get(key)
+                if metric is None:
+                    metric = factory()
+                    metrics[key] = metric
+
+        return metric
+
+    def dumpIfDue(self, extra=None):
+        # Only the request which moves the next dump time dumps the metrics
+        nextDump = self.nextDump.get()
+        now = System.currentTimeMillis()
+        if self.interval <= 0 or now < nextDump or not self.nextDump.compareAndSet(nextDump, now + self.interval):
+            return
+
+        self.dump(extra)
+
+    def dump(self, extra=None):
+        counters = sorted(self.counters.items())
+        histograms = sorted(self.histograms.items())
+
+        lines = []
+        for configId in sorted(set([key[0] for (key, metric) in counters + histograms])):
+            values = ["%s=%d" % (key[1], metric.get()) for (key, metric) in counters if key[0] == configId]
+            values += ["%s: %s" % (key[1], metric.summary()) for (key, metric) in histograms if key[0] == configId]
+            lines.append("Basic (multi auth conf & lock account). Metrics. " + configId + ". " + ", ".join(values))
+        if extra:
+            lines.append("Basic (multi auth conf & lock account). Metrics. " + extra)
+
+        for line in lines:
+            print(line)
+
+        if self.path:
+            try:
+                f = open(self.path, 'a')
+                try:
+                    for line in lines:
+                        f.write("%d %s\n" % (System.currentTimeMillis(), line))
+                finally:
+                    f.close()
+            except IOError:
+                print("Basic (multi auth conf & lock account). Metrics. Failed to write to file:", self.path)
+
+
 class PersonAuthentication(PersonAuthenticationType):
     def __init__(self, currentTimeMillis):
         self.currentTimeMillis = currentTimeMillis
 
+        # Number of writes of the invalid login counter avoided because it was already 0
+        self.avoidedCounterWrites = AtomicLong(0)
+
     def init(self, configurationAttributes):
         print("Basic (multi auth conf & lock account). Initialization")
 
+        # Print the messages of each request
+        self.debugEnabled = False
+        if configurationAttributes.containsKey("debug"):
+            self.debugEnabled = StringHelper.equalsIgnoreCase(
+                configurationAttributes.get("debug").getValue2(), "true")
+
+        metricsInterval = 300
+        if configurationAttributes.containsKey("metrics_interval"):
+            metricsInterval = StringHelper.toInteger(
+                configurationAttributes.get("metrics_interval").getValue2(), metricsInterval)
+
+        metricsFile = None
+        if configurationAttributes.containsKey("metrics_file"):
+            metricsFile = configurationAttributes.get("metrics_file").getValue2()
+
+        self.metrics = Metrics(metricsInterval, metricsFile)
+
         if (not configurationAttributes.containsKey("auth_configuration_file")):
             print("Basic (multi auth conf & lock account). The property auth_configuration_file is empty")
             return False
@@ -43,8 +271,37 @@ class PersonAuthentication(PersonAuthenticationType):
         else:
             print("Basic (multi auth conf & lock account). Initialization. Using default number attempts")
 
+        # Failures are counted in memory by each node, in a window of `lockout_window` seconds:
+        # with N nodes, up to N times `maximum_invalid_login_attemps` failures are allowed per window
+        lockoutWindow = 900
+        if configurationAttributes.containsKey("lockout_window"):
+            lockoutWindow = StringHelper.toInteger(
+                configurationAttributes.get("lockout_window").getValue2(), lockoutWindow)
+
+        lockoutTrackerSize = 10000
+        if configurationAttributes.containsKey("lockout_tracker_size"):
+            lockoutTrackerSize = StringHelper.toInteger(
+                configurationAttributes.get("lockout_tracker_size").getValue2(), lockoutTrackerSize)
+
+        self.lockoutTracker = LockoutTracker(
+            lockoutWindow, lockoutTrackerSize, self.maximumInvalidLoginAttemps)
+
+        # Backend which last authenticated each user, tried before the other backends
+        routingCacheSize = 10000
+        if configurationAttributes.containsKey("routing_cache_size"):
+            routingCacheSize = StringHelper.toInteger(
+                configurationAttributes.get("routing_cache_size").getValue2(), routingCacheSize)
+
+        routingCacheTtl = 3600
+        if configurationAttributes.containsKey("routing_cache_ttl"):
+            routingCacheTtl = StringHelper.toInteger(
+                configurationAttributes.get("routing_cache_ttl").getValue2(), routingCacheTtl)
+
+        self.routingCache = RoutingCache(routingCacheSize, routingCacheTtl)
+
         authConfigurationFile = configurationAttributes.get(
             "auth_configuration_file").getValue2()
+        authConfigurationMtime = self.getAuthConfigurationMtime(authConfigurationFile)
         authConfiguration = self.loadAuthConfiguration(authConfigurationFile)
         if authConfiguration is None:
             print("Basic (multi auth conf & lock account). File with authentication configuration should be not empty")
@@ -61,6 +318,23 @@ class PersonAuthentication(PersonAuthenticationType):
 
         self.ldapExtendedEntryManagers = ldapExtendedEntryManagers
 
+        # The file is checked for changes every `auth_configuration_check_interval` seconds, 0 to disable it
+        self.authConfigurationFile = authConfigurationFile
+        self.authConfigurationMtime = authConfigurationMtime
+        self.authConfigurationCheckInterval = 10000
+        if configurationAttributes.containsKey("auth_configuration_check_interval"):
+            self.authConfigurationCheckInterval = 1000 * StringHelper.toInteger(
+                configurationAttributes.get("auth_configuration_check_interval").getValue2(), 10)
+        self.authConfigurationNextCheck = System.currentTimeMillis() + self.authConfigurationCheckInterval
+        self.reloadLock = threading.Lock()
+        # Entry managers removed by a reload, destroyed `retired_entry_manager_delay` seconds later
+        # so the requests still using them can complete
+        self.retiredEntryManagerDelay = 60000
+        if configurationAttributes.containsKey("retired_entry_manager_delay"):
+            self.retiredEntryManagerDelay = 1000 * StringHelper.toInteger(
+                configurationAttributes.get("retired_entry_manager_delay").getValue2(), 60)
+        self.retiredEntryManagers = []
+
         print("Basic (multi auth conf & lock account). Initialized successfully")
         return True
 
@@ -68,7 +342,9 @@ class PersonAuthentication(PersonAuthenticationType):
         print("Basic (multi auth conf & lock account). Destroy")
 
         result = True
-        for ldapExtendedEntryManager in self.ldapExtendedEntryManagers:
+        retiredEntryManagers = [retired for (retireTime, retired) in self.retiredEntryManagers]
+        self.retiredEntryManagers = []
+        for ldapExtendedEntryManager in self.ldapExtendedEntryManagers + retiredEntryManagers:
             ldapConfiguration = ldapExtendedEntryManager["ldapConfiguration"]
             ldapEntryManager = ldapExtendedEntryManager["ldapEntryManager"]
 
@@ -77,6 +353,8 @@ class PersonAuthentication(PersonAuthenticationType):
             print("Basic (multi auth conf & lock account). Destroyed: " +
                   ldapConfiguration.getConfigId() + ". Result: " + str(destoryResult))
 
+        self.metrics.dump(self.getMetricsSummary())
+
         print("Basic (multi auth conf & lock account). Destroyed successfully")
 
         return result
@@ -92,14 +370,15 @@ class PersonAuthentication(PersonAuthenticationType):
 
     def authenticate(self, configurationAttributes, requestParameters, step):
         if (step == 1):
-            print("Basic (multi auth conf & lock account). Authenticate for step 1")
+            self.debug("Basic (multi auth conf & lock account). Authenticate for step 1")
+            self.metrics.dumpIfDue(self.getMetricsSummary())
 
             credentials = Identity.instance().getCredentials()
             keyValue = credentials.getUsername()
             userPassword = credentials.getPassword()
 
             if not StringHelper.isNotEmptyString(keyValue) or not StringHelper.isNotEmptyString(userPassword):
-                print("Basic (multi auth conf & lock account). Missing fields ")
+                self.debug("Basic (multi auth conf & lock account). Missing fields ")
                 faces_messages = FacesMessages.instance()
                 faces_messages.clear()
                 FacesContext.getCurrentInstance().getExternalContext().getFlash().setKeepMessages(True)
@@ -109,9 +388,12 @@ class PersonAuthentication(PersonAuthenticationType):
 
             keyValue = keyValue.strip()
 
-            user_status = self.getUserAttributeValue(keyValue, "gluuStatus")
+            # Load the user once with all its attributes for the status, the counter and the lock
+            user = self.getUser(keyValue)
+
+            user_status = self.getUserAttributeValue(user, "gluuStatus")
             if user_status is not None and user_status != "active":
-                print("Basic (multi auth conf & lock account). Account locked for user '%s'" % keyValue)
+                self.debug("Basic (multi auth conf & lock account). Account locked for user '%s'" % keyValue)
                 faces_messages = FacesMessages.instance()
                 faces_messages.clear()
                 FacesContext.getCurrentInstance().getExternalContext().getFlash().setKeepMessages(True)
@@ -123,60 +405,109 @@ class PersonAuthentication(PersonAuthenticationType):
                 authenticationService = Component.getInstance(
                     AuthenticationService)
 
-                logged_in = False
-                for ldapExtendedEntryManager in self.ldapExtendedEntryManagers:
-                    if logged_in:
-                        break
+                self.reloadAuthConfiguration()
 
-                    ldapConfiguration = ldapExtendedEntryManager["ldapConfiguration"]
-                    ldapEntryManager = ldapExtendedEntryManager["ldapEntryManager"]
-                    loginAttributes = ldapExtendedEntryManager["loginAttributes"]
-                    localLoginAttributes = ldapExtendedEntryManager["localLoginAttributes"]
-
-                    print("Basic (multi auth conf & lock account). Authenticate for step 1. Using configuration: " +
-                          ldapConfiguration.getConfigId())
-
-                    idx = 0
-                    count = len(loginAttributes)
-                    while (idx < count):
-                        primaryKey = loginAttributes[idx]
-                        localPrimaryKey = localLoginAttributes[idx]
-
-                        loggedIn = authenticationService.authenticate(
-                            ldapConfiguration, ldapEntryManager, keyValue, userPassword, primaryKey, localPrimaryKey)
-                        if (loggedIn):
-                            logged_in = True
-                            break
-                        idx += 1
+                logged_in = self.authenticateWithBackends(
+                    authenticationService, keyValue, userPassword)
 
                 if logged_in:
-                    self.setUserAttributeValue(
-                        keyValue, self.invalidLoginCountAttribute, StringHelper.toString(0))
+                    self.lockoutTracker.reset(keyValue)
+                    countInvalidLogin = StringHelper.toInteger(self.getUserAttributeValue(
+                        user, self.invalidLoginCountAttribute), 0)
+                    if countInvalidLogin != 0:
+                        self.setUserAttributeValue(
+                            user, self.invalidLoginCountAttribute, StringHelper.toString(0))
+                    else:
+                        self.avoidedCounterWrites.incrementAndGet()
 
                     return True
 
                 countInvalidLoginArributeValue = self.getUserAttributeValue(
-                    keyValue, self.invalidLoginCountAttribute)
-                countInvalidLogin = StringHelper.toInteger(
+                    user, self.invalidLoginCountAttribute)
+                savedCountInvalidLogin = StringHelper.toInteger(
                     countInvalidLoginArributeValue, 0)
 
-                if countInvalidLogin < self.maximumInvalidLoginAttemps:
-                    countInvalidLogin = countInvalidLogin + 1
-                    self.setUserAttributeValue(
-                        keyValue, self.invalidLoginCountAttribute, StringHelper.toString(countInvalidLogin))
+                countInvalidLogin = self.lockoutTracker.failure(keyValue)
 
                 if countInvalidLogin >= self.maximumInvalidLoginAttemps:
-                    self.lockUser(keyValue)
-                    self.setUserAttributeValue(
-                        keyValue, self.invalidLoginCountAttribute, StringHelper.toString(0))
+                    self.metrics.count("local", "lockouts")
+                    self.lockUser(user)
+                    self.lockoutTracker.reset(keyValue)
+                    if savedCountInvalidLogin != 0:
+                        self.setUserAttributeValue(
+                            user, self.invalidLoginCountAttribute, StringHelper.toString(0))
 
             return False
         else:
             return False
 
+    def authenticateWithBackends(self, authenticationService, keyValue, userPassword):
+        # Try the backend which last authenticated the user first
+        route = self.routingCache.get(keyValue)
+        if route is not None:
+            (configId, idx) = route
+            for ldapExtendedEntryManager in self.ldapExtendedEntryManagers:
+                if ldapExtendedEntryManager["ldapConfiguration"].getConfigId() == configId:
+                    if idx < len(ldapExtendedEntryManager["loginAttributes"]) and self.authenticateWithBackend(
+                            authenticationService, ldapExtendedEntryManager, idx, keyValue, userPassword):
+                        return True
+                    break
+
+        # The same login may exist on several backends, so every other backend is still tried. The
+        # route is kept when none of them authenticates the user, as the password was likely wrong
+        for ldapExtendedEntryManager in self.ldapExtendedEntryManagers:
+            configId = ldapExtendedEntryManager["ldapConfiguration"].getConfigId()
+
+            self.debug("Basic (multi auth conf & lock account). Authenticate for step 1. Using configuration: " + configId)
+
+            idx = 0
+            count = len(ldapExtendedEntryManager["loginAttributes"])
+            while (idx < count):
+                # Already tried from the routing cache
+                if route == (configId, idx):
+                    idx += 1
+                    continue
+
+                if self.authenticateWithBackend(
+                        authenticationService, ldapExtendedEntryManager, idx, keyValue, userPassword):
+                    self.routingCache.put(keyValue, (configId, idx))
+                    return True
+                idx += 1
+
+        return False
+
+    def authenticateWithBackend(self, authenticationService, ldapExtendedEntryManager, idx, keyValue, userPassword):
+        ldapConfiguration = ldapExtendedEntryManager["ldapConfiguration"]
+        ldapEntryManager = ldapExtendedEntryManager["ldapEntryManager"]
+        primaryKey = ldapExtendedEntryManager["loginAttributes"][idx]
+        localPrimaryKey = ldapExtendedEntryManager["localLoginAttributes"][idx]
+
+        configId = ldapConfiguration.getConfigId()
+        self.metrics.count(configId, "bind_attempts")
+
+        startTime = System.currentTimeMillis()
+        loggedIn = authenticationService.authenticate(
+            ldapConfiguration, ldapEntryManager, keyValue, userPassword, primaryKey, localPrimaryKey)
+        self.metrics.time(configId, "bind", startTime)
+
+        if loggedIn:
+            self.metrics.count(configId, "bind_successes")
+        else:
+            self.metrics.count(configId, "bind_failures")
+
+        return loggedIn
+
+    def getMetricsSummary(self):
+        return "Avoided counter writes: " + str(self.avoidedCounterWrites.get()) + \
+            ". Routing cache: " + self.routingCache.stats()
+
+    def debug(self, message):
+        if self.debugEnabled:
+            print(message)
+
     def prepareForStep(self, configurationAttributes, requestParameters, step):
         if step == 1:
-            print("Basic (multi auth conf & lock account). Prepare for Step 1")
+            self.debug("Basic (multi auth conf & lock account). Prepare for Step 1")
             return True
         else:
             return False
@@ -208,6 +539,72 @@ class PersonAuthentication(PersonAuthenticationType):
 
         return authConfiguration
 
+    def getAuthConfigurationMtime(self, authConfigurationFile):
+        try:
+            return os.path.getmtime(authConfigurationFile)
+        except OSError:
+            return None
+
+    def reloadAuthConfiguration(self):
+        """ Rebuild the entry managers whose configuration changed in the file.
+            The entry managers of the unchanged configurations are kept with their connections. """
+        now = System.currentTimeMillis()
+        if self.authConfigurationCheckInterval <= 0 or now < self.authConfigurationNextCheck:
+            return
+
+        # Only one request checks the file, the others keep going with the current entry managers
+        if not self.reloadLock.acquire(False):
+            return
+
+        try:
+            self.authConfigurationNextCheck = now + self.authConfigurationCheckInterval
+            self.destroyRetiredEntryManagers(now)
+
+            authConfigurationMtime = self.getAuthConfigurationMtime(self.authConfigurationFile)
+            if authConfigurationMtime is None or authConfigurationMtime == self.authConfigurationMtime:
+                return
+
+            self.authConfigurationMtime = authConfigurationMtime
+
+            authConfiguration = self.loadAuthConfiguration(self.authConfigurationFile)
+            if authConfiguration is None or not self.validateAuthConfiguration(authConfiguration):
+                print("Basic (multi auth conf & lock account). Reload auth configuration. Invalid configuration, the current one is kept")  # noqa
+                return
+
+            previousEntryManagers = self.ldapExtendedEntryManagers
+            ldapExtendedEntryManagers = self.createLdapExtendedEntryManagers(
+                authConfiguration, previousEntryManagers)
+            if ldapExtendedEntryManagers is None:
+                return
+
+            self.ldapExtendedEntryManagers = ldapExtendedEntryManagers
+
+            # The requests in progress may still bind through the removed entry managers
+            for ldapExtendedEntryManager in previousEntryManagers:
+                if any(ldapExtendedEntryManager is kept for kept in ldapExtendedEntryManagers):
+                    continue
+
+                self.retiredEntryManagers.append((now, ldapExtendedEntryManager))
+
+            print("Basic (multi auth conf & lock account). Reload auth configuration. Reloaded successfully")
+        finally:
+            self.reloadLock.release()
+
+    def destroyRetiredEntryManagers(self, now):
+        """ Destroy the entry managers removed by a reload more than `retiredEntryManagerDelay` ago.
+            Called with the reload lock held. """
+        retiredEntryManagers = []
+        for (retireTime, ldapExtendedEntryManager) in self.retiredEntryManagers:
+            if now - retireTime < self.retiredEntryManagerDelay:
+                retiredEntryManagers.append((retireTime, ldapExtendedEntryManager))
+                continue
+
+            destoryResult = ldapExtendedEntryManager["ldapEntryManager"].destroy()
+            print("Basic (multi auth conf & lock account). Reload auth configuration. Destroyed: " +
+                  ldapExtendedEntryManager["ldapConfiguration"].getConfigId() + ". Result: " + str(destoryResult))
+
+        self.retiredEntryManagers = retiredEntryManagers
+
     def validateAuthConfiguration(self, authConfiguration):
         if (not ("ldap_configuration" in authConfiguration)):
             print("Basic (multi auth conf & lock account). Validate auth configuration. There is no ldap_configuration section in configuration")  # noqa
@@ -264,22 +661,34 @@ class PersonAuthentication(PersonAuthenticationType):
 
         return True
 
-    def createLdapExtendedEntryManagers(self, authConfiguration):
+    def createLdapExtendedEntryManagers(self, authConfiguration, previousEntryManagers=None):
         ldapExtendedConfigurations = self.createLdapExtendedConfigurations(
             authConfiguration)
 
         appInitializer = Component.getInstance(AppInitializer)
 
+        # Entry managers which can be kept, by hash of their configuration
+        previous = {}
+        for ldapExtendedEntryManager in previousEntryManagers or []:
+            previous[ldapExtendedEntryManager["configHash"]] = ldapExtendedEntryManager
+
         ldapExtendedEntryManagers = []
         for ldapExtendedConfiguration in ldapExtendedConfigurations:
-            ldapEntryManager = appInitializer.createLdapAuthEntryManager(
-                ldapExtendedConfiguration["ldapConfiguration"])
-            ldapExtendedEntryManagers.append({
-                "ldapConfiguration": ldapExtendedConfiguration["ldapConfiguration"],
-                "loginAttributes": ldapExtendedConfiguration["loginAttributes"],
-                "localLoginAttributes": ldapExtendedConfiguration["localLoginAttributes"],
-                "ldapEntryManager": ldapEntryManager
-            })
+            ldapExtendedEntryManager = previous.pop(ldapExtendedConfiguration["configHash"], None)
+            if ldapExtendedEntryManager is None:
+                ldapEntryManager = appInitializer.createLdapAuthEntryManager(
+                    ldapExtendedConfiguration["ldapConfiguration"])
+                ldapExtendedEntryManager = {
+                    "ldapConfiguration": ldapExtendedConfiguration["ldapConfiguration"],
+                    "loginAttributes": ldapExtendedConfiguration["loginAttributes"],
+                    "localLoginAttributes": ldapExtendedConfiguration["localLoginAttributes"],
+                    "configHash": ldapExtendedConfiguration["configHash"],
+                    "ldapEntryManager": ldapEntryManager
+                }
+                print("Basic (multi auth conf & lock account). Created: " +
+                      ldapExtendedConfiguration["ldapConfiguration"].getConfigId())
+
+            ldapExtendedEntryManagers.append(ldapExtendedEntryManager)
 
         return ldapExtendedEntryManagers
 
@@ -288,6 +697,7 @@ class PersonAuthentication(PersonAuthenticationType):
 
         for ldapConfiguration in authConfiguration["ldap_configuration"]:
             configId = ldapConfiguration["configId"]
+            configHash = hashlib.sha1(json.dumps(ldapConfiguration, sort_keys=True)).hexdigest()
 
             servers = ldapConfiguration["servers"]
 
@@ -312,7 +722,8 @@ class PersonAuthentication(PersonAuthenticationType):
             ldapExtendedConfigurations.append({
                 "ldapConfiguration": ldapConfiguration,
                 "loginAttributes": loginAttributes,
-                "localLoginAttributes": localLoginAttributes
+                "localLoginAttributes": localLoginAttributes,
+                "configHash": configHash
             })
 
         return ldapExtendedConfigurations
@@ -323,65 +734,72 @@ class PersonAuthentication(PersonAuthenticationType):
     def containsAttributeArray(self, dictionary, attribute):
         return ((attribute in dictionary) and (len(dictionary[attribute]) > 0))
 
-    def getUserAttributeValue(self, user_name, attribute_name):
+    def getAvoidedCounterWrites(self):
+        return self.avoidedCounterWrites.get()
+
+    def getUser(self, user_name):
         if StringHelper.isEmpty(user_name):
             return None
 
         userService = UserService.instance()
 
-        find_user_by_uid = userService.getUser(user_name, attribute_name)
-        if find_user_by_uid is None:
+        startTime = System.currentTimeMillis()
+        user = userService.getUser(user_name)
+        self.metrics.time("local", "user_read", startTime)
+
+        return user
+
+    def getUserAttributeValue(self, user, attribute_name):
+        if user is None:
             return None
 
+        userService = UserService.instance()
+
         custom_attribute_value = userService.getCustomAttribute(
-            find_user_by_uid, attribute_name)
+            user, attribute_name)
         if custom_attribute_value is None:
             return None
 
         attribute_value = custom_attribute_value.getValue()
 
-        print("Basic (multi auth conf & lock account). Get user attribute. User's '%s' attribute '%s' value is '%s'" % (user_name, attribute_name, attribute_value))  # noqa
+        self.debug("Basic (multi auth conf & lock account). Get user attribute. User's '%s' attribute '%s' value is '%s'" % (user.getUserId(), attribute_name, attribute_value))  # noqa
 
         return attribute_value
 
-    def setUserAttributeValue(self, user_name, attribute_name, attribute_value):
-        if StringHelper.isEmpty(user_name):
+    def setUserAttributeValue(self, user, attribute_name, attribute_value):
+        if user is None:
             return None
 
         userService = UserService.instance()
 
-        find_user_by_uid = userService.getUser(user_name)
-        if find_user_by_uid is None:
-            return None
-
         userService.setCustomAttribute(
-            find_user_by_uid, attribute_name, attribute_value)
-        updated_user = userService.updateUser(find_user_by_uid)
+            user, attribute_name, attribute_value)
+        startTime = System.currentTimeMillis()
+        updated_user = userService.updateUser(user)
+        self.metrics.time("local", "user_write", startTime)
 
-        print("Basic (multi auth conf & lock account). Set user attribute. User's '%s' attribute '%s' value is '%s'" % (user_name, attribute_name, attribute_value))  # noqa
+        self.debug("Basic (multi auth conf & lock account). Set user attribute. User's '%s' attribute '%s' value is '%s'" % (user.getUserId(), attribute_name, attribute_value))  # noqa
 
         return updated_user
 
-    def lockUser(self, user_name):
-        if StringHelper.isEmpty(user_name):
+    def lockUser(self, user):
+        if user is None:
             return None
 
         userService = UserService.instance()
 
-        find_user_by_uid = userService.getUser(user_name)
-        if (find_user_by_uid is None):
-            return None
-
         status_attribute_value = userService.getCustomAttribute(
-            find_user_by_uid, "gluuStatus")
+            user, "gluuStatus")
         if status_attribute_value is not None:
             user_status = status_attribute_value.getValue()
             if StringHelper.equals(user_status, "inactive"):
-                print("Basic (multi auth conf & lock account). Lock user. User '%s' locked already" % user_name)  # noqa
+                self.debug("Basic (multi auth conf & lock account). Lock user. User '%s' locked already" % user.getUserId())  # noqa
                 return
 
         userService.setCustomAttribute(
-            find_user_by_uid, "gluuStatus", "inactive")
-        userService.updateUser(find_user_by_uid)
+            user, "gluuStatus", "inactive")
+        startTime = System.currentTimeMillis()
+        userService.updateUser(user)
+        self.metrics.time("local", "user_write", startTime)
 
-        print("Basic (multi auth conf & lock account). Lock user. User '%s' locked" % user_name)  # noqa
+        print("Basic (multi auth conf & lock account). Lock user. User '%s' locked" % user.getUserId())  # noqa
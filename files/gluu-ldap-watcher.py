@@ -0,0 +1,234 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Watch the changes made on the Gluu LDAP server with a persistent search
+# (OpenDJ) or a RFC 4533 syncrepl session (OpenLDAP) and record the changed
+# DNs in a JSONL journal, read by the ldap_upsert and ldap_journal modules to
+# only reconcile the entries changed outside of Ansible.
+#
+# The journal format and its lock are shared with
+# module_utils/gluu_ldap_journal.py.
+
+import argparse
+import datetime
+import fcntl
+import json
+import os
+import sys
+import time
+
+import ldap
+import ldap.controls.psearch
+import ldap.ldapobject
+import ldap.syncrepl
+
+
+# Entries managed by the role: appliances, oxAuth and oxTrust configurations,
+# scripts, attributes, scopes, clients, groups and people
+DEFAULT_FILTER = (
+    '(|(objectClass=gluuAppliance)(objectClass=oxAuthConfiguration)'
+    '(objectClass=oxTrustConfiguration)(objectClass=oxCustomScript)'
+    '(objectClass=gluuAttribute)(objectClass=oxAuthCustomScope)'
+    '(objectClass=oxAuthClient)(objectClass=gluuGroup)'
+    '(objectClass=gluuPerson))')
+
+PSEARCH_CHANGES = {1: 'add', 2: 'delete', 4: 'modify', 8: 'moddn'}
+
+
+def log(message):
+    sys.stderr.write('%s\n' % message)
+    sys.stderr.flush()
+
+
+class JournalWriter(object):
+    """ Append the changes to the journal, under the lock of the journal. """
+    def __init__(self, path):
+        self.path = path
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def append(self, change, dn=None, previous_dn=None):
+        record = {
+            'time': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'change': change,
+        }
+        if dn is not None:
+            record['dn'] = dn
+        if previous_dn is not None:
+            record['previous_dn'] = previous_dn
+
+        line = json.dumps(record, sort_keys=True) + '\n'
+
+        with open('%s.lock' % self.path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class SyncreplWatcher(ldap.ldapobject.LDAPObject,
+                      ldap.syncrepl.SyncreplConsumer):
+    """ RFC 4533 refreshAndPersist consumer.
+
+    The sync cookie is saved next to the journal, so the refresh phase after
+    a restart only returns the entries changed while the watcher was down.
+    Without a cookie, the refresh phase returns every entry: nothing is
+    journaled but a resync record.
+    """
+    def __init__(self, uri, journal, cookie_path):
+        ldap.ldapobject.LDAPObject.__init__(self, uri)
+        self.journal = journal
+        self.cookie_path = cookie_path
+        self.uuids = {}
+
+        self.cookie = None
+        if os.path.exists(self.cookie_path):
+            with open(self.cookie_path) as f:
+                self.cookie = f.read().strip() or None
+
+        self.initial_refresh = self.cookie is None
+        if self.initial_refresh:
+            self.journal.append('resync')
+
+    def syncrepl_get_cookie(self):
+        return self.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self.cookie = cookie
+
+        tmp_path = '%s.%d.tmp' % (self.cookie_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(cookie)
+        os.rename(tmp_path, self.cookie_path)
+
+    def syncrepl_entry(self, dn, attributes, uuid):
+        previous_dn = self.uuids.get(uuid)
+        self.uuids[uuid] = dn
+
+        if self.initial_refresh:
+            return
+
+        if previous_dn is not None and previous_dn != dn:
+            self.journal.append('moddn', dn, previous_dn)
+        else:
+            self.journal.append('modify', dn)
+
+    def syncrepl_delete(self, uuids):
+        for uuid in uuids:
+            dn = self.uuids.pop(uuid, None)
+            # The DN of an entry deleted while the watcher was down is unknown
+            if dn is None:
+                self.journal.append('resync')
+            else:
+                self.journal.append('delete', dn)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        pass
+
+    def syncrepl_refreshdone(self):
+        self.initial_refresh = False
+
+
+def watch_syncrepl(args, journal):
+    watcher = SyncreplWatcher(args.uri, journal, '%s.cookie' % args.journal)
+    watcher.simple_bind_s(args.bind_dn, args.bind_pw)
+
+    msgid = watcher.syncrepl_search(
+        args.base, ldap.SCOPE_SUBTREE, mode='refreshAndPersist',
+        filterstr=args.filter, attrlist=['1.1'])
+
+    while watcher.syncrepl_poll(all=1, msgid=msgid):
+        pass
+
+
+def watch_psearch(args, journal):
+    connection = ldap.initialize(args.uri)
+    connection.simple_bind_s(args.bind_dn, args.bind_pw)
+
+    # A persistent search cannot be resumed: the changes made before it has
+    # started are unknown
+    journal.append('resync')
+
+    control = ldap.controls.psearch.PersistentSearchControl(
+        criticality=True, changesOnly=True, returnECs=True)
+    msgid = connection.search_ext(
+        args.base, ldap.SCOPE_SUBTREE, args.filter, attrlist=['1.1'],
+        serverctrls=[control])
+
+    ec_types = {
+        ldap.controls.psearch.EntryChangeNotificationControl.controlType:
+            ldap.controls.psearch.EntryChangeNotificationControl,
+    }
+
+    while True:
+        rdata = connection.result4(
+            msgid, all=0, timeout=-1, add_ctrls=1,
+            resp_ctrl_classes=ec_types)[1]
+
+        for (dn, attributes, controls) in rdata:
+            change = 'modify'
+            previous_dn = None
+
+            for control in controls:
+                if isinstance(
+                        control,
+                        ldap.controls.psearch.EntryChangeNotificationControl):
+                    change = PSEARCH_CHANGES.get(control.changeType, 'modify')
+                    previous_dn = control.previousDN
+
+            journal.append(change, dn, previous_dn)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Journal the changes made on the Gluu LDAP server.')
+    parser.add_argument('--uri', default='ldaps://localhost:1636')
+    parser.add_argument('--bind-dn', default=os.environ.get('GLUU_LDAP_BIND_DN'))
+    parser.add_argument('--bind-pw', default=os.environ.get('GLUU_LDAP_BIND_PW'))
+    parser.add_argument(
+        '--bind-pw-file', help='file whose content is the bind password')
+    parser.add_argument('--base', default='o=gluu')
+    parser.add_argument('--filter', default=DEFAULT_FILTER)
+    parser.add_argument(
+        '--mode', choices=['psearch', 'syncrepl'], default='psearch')
+    parser.add_argument(
+        '--journal', default='/var/lib/gluu-configuration/ldap-journal.jsonl')
+    parser.add_argument('--retry-delay', type=int, default=10)
+    parser.add_argument('--no-verify-cert', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.bind_pw_file:
+        with open(args.bind_pw_file) as f:
+            args.bind_pw = f.read().rstrip('\r\n')
+
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.no_verify_cert:
+        ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+
+    journal = JournalWriter(args.journal)
+    watch = watch_syncrepl if args.mode == 'syncrepl' else watch_psearch
+
+    while True:
+        try:
+            watch(args, journal)
+        except ldap.LDAPError as e:
+            log('LDAP error, reconnecting in %ds: %s' % (args.retry_delay, e))
+            time.sleep(args.retry_delay)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+DOCUMENTATION = '''
+---
+filter: gluu_idp_authentication
+author: "Guillaume Smaha"
+short_description: Render the oxIDPAuthentication value of the appliance from the LDAP servers
+description:
+Render the canonical JSON of `oxIDPAuthentication` from a list of LDAP servers and a config dict.
+The servers are either `host:port` strings, a comma separated string of them, or the host vars of the
+inventory hosts: only the hosts with `ldap` in `gluu_modules` are used, with their `gluu_internal_hostname`.
+The servers are sorted and the keys of the JSON objects are sorted, so the value is identical from one run
+to another whatever the order of the inventory.
+The top-level keys of the current value of `oxIDPAuthentication`, given in `current`, are kept (enabled,
+priority, ...) so the settings made on the server are not overwritten: only `config` is rendered again.
+The value is returned as is, to be stored as is in LDAP: wrap it in a list where it is templated alone in a
+task (`"{{ [servers | gluu_idp_authentication] }}"`), so ansible does not turn it into a dict.
+author:
+  - Guillaume Smaha
+options:
+    name: config
+        required: false
+        description: Keys of the config of the LDAP server, overwriting the default ones (bindDN, baseDNs, ...)
+    name: current
+        required: false
+        description: Current value of oxIDPAuthentication, as a JSON string or a dict. Its keys, except config,
+                     overwrite the default ones
+    name: auth
+        required: false
+        description: Keys of the oxIDPAuthentication object, overwriting the default and the current ones
+                     (type, priority, ...)
+    name: port
+        required: false
+        default: 1636
+        description: Port of the servers built from the host vars
+'''
+
+EXAMPLES = '''
+---
+- hosts: gluu-servers
+  tasks:
+    - name: Print a message
+      debug:
+        msg: >-
+          {{ [groups['gluu-servers'] | map('extract', hostvars) | list
+              | gluu_idp_authentication(config={'bindPassword': 'encrypted'})] }}
+
+'{"config": "{\\"baseDNs\\":[\\"o=gluu\\"],\\"bindDN\\":\\"cn=directory manager,o=gluu\\",
+  \\"bindPassword\\":\\"encrypted\\",...,\\"servers\\":[\\"gluu1.local:1636\\",\\"gluu2.local:1636\\"],...}",
+  "enabled": false, ...}'
+
+'''
+
+import json
+
+from ansible import errors
+from ansible.module_utils.six import string_types
+
+
+DEFAULT_CONFIG = {
+    'configId': 'auth_ldap_server',
+    'bindDN': 'cn=directory manager,o=gluu',
+    'maxConnections': 1000,
+    'useSSL': True,
+    'baseDNs': ['o=gluu'],
+    'primaryKey': 'uid',
+    'localPrimaryKey': 'uid',
+    'useAnonymousBind': False,
+    'enabled': True,
+    'version': 0,
+    'level': 0,
+}
+
+DEFAULT_AUTH = {
+    'type': 'auth',
+    'name': None,
+    'level': 0,
+    'priority': 1,
+    'enabled': False,
+    'version': 0,
+}
+
+
+class FilterModule(object):
+    def filters(self):
+        return {
+            'gluu_idp_authentication': self.gluu_idp_authentication
+        }
+
+    def gluu_idp_authentication(self, servers, config=None, auth=None, port=1636, current=None, *args, **kw):
+        servers = self.servers(servers, port)
+        if not servers:
+            raise errors.AnsibleFilterError(
+                '[gluu_idp_authentication] One LDAP server is required at least.')
+
+        ldap_config = dict(DEFAULT_CONFIG)
+        ldap_config.update(config or {})
+        ldap_config['servers'] = servers
+
+        content = dict(DEFAULT_AUTH)
+        content.update(self.current(current))
+        content.update(auth or {})
+        content['config'] = self.dumps(ldap_config)
+
+        return self.dumps(content)
+
+    def current(self, current):
+        if not current:
+            return {}
+
+        if isinstance(current, string_types):
+            try:
+                current = json.loads(current)
+            except ValueError:
+                raise errors.AnsibleFilterError(
+                    '[gluu_idp_authentication] The current value must be a JSON object.')
+
+        if not isinstance(current, dict):
+            raise errors.AnsibleFilterError(
+                '[gluu_idp_authentication] The current value must be a JSON object.')
+
+        return dict((key, value) for (key, value) in current.items() if key != 'config')
+
+    def servers(self, servers, port):
+        if isinstance(servers, string_types):
+            servers = servers.split(',')
+
+        if not isinstance(servers, list):
+            raise errors.AnsibleFilterError(
+                '[gluu_idp_authentication] Input must be a list of servers or of host vars.')
+
+        result = set()
+        for server in servers:
+            if isinstance(server, string_types):
+                server = server.strip()
+            elif 'ldap' in (server.get('gluu_modules') or []):
+                host = server.get('gluu_internal_hostname') or server.get('inventory_hostname')
+                server = '%s:%s' % (host, port)
+            else:
+                continue
+
+            if server:
+                result.add(server)
+
+        return sorted(result)
+
+    def dumps(self, content):
+        return json.dumps(content, sort_keys=True, separators=(',', ':'))
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+DOCUMENTATION = '''
+---
+filter: gluu_ldif
+author: "Guillaume Smaha"
+short_description: Render a list of entries as a deterministic LDIF content
+description:
+Render a list of entries as a LDIF content ready for an offline import (import-ldif).
+The entries are sorted parent-first, objectClass is written first and the other attributes
+are sorted by name, so the same entries always give the same content.
+author:
+  - Guillaume Smaha
+options:
+    name: dn_key
+        required: false
+        description: Key of the dn in each entry (default: dn)
+'''
+
+EXAMPLES = '''
+---
+gluu_entries:
+  - dn: 'inum=@!1111!0000!0010,ou=people,o=@!1111,o=gluu'
+    objectClass:
+      - top
+      - gluuPerson
+    uid: myUser
+  - dn: 'ou=people,o=@!1111,o=gluu'
+    objectClass:
+      - top
+      - organizationalUnit
+    ou: people
+
+- hosts: localhost
+  tasks:
+    - name: Write the LDIF file
+      copy:
+        content: "{{ gluu_entries | gluu_ldif }}"
+        dest: /tmp/entries.ldif
+
+dn: ou=people,o=@!1111,o=gluu
+objectClass: top
+objectClass: organizationalUnit
+ou: people
+
+dn: inum=@!1111!0000!0010,ou=people,o=@!1111,o=gluu
+objectClass: top
+objectClass: gluuPerson
+uid: myUser
+'''
+
+from ansible import errors
+from ansible.module_utils.six import string_types
+import base64
+import re
+
+
+class FilterModule(object):
+    def filters(self):
+        return {
+            'gluu_ldif': self.gluu_ldif
+        }
+
+    def gluu_ldif(self, content, dn_key='dn', *args, **kw):
+        if isinstance(content, dict):
+            content = [content]
+
+        if not isinstance(content, list):
+            raise errors.AnsibleFilterError(
+                '[gluu_ldif] Input must be a list of entries.')
+
+        entries = []
+        for entry in content:
+            if not isinstance(entry, dict) or not entry.get(dn_key):
+                raise errors.AnsibleFilterError(
+                    '[gluu_ldif] Each entry must be a dict with the key %s.' % dn_key)
+
+            attrs = dict((k, v) for (k, v) in entry.items() if k != dn_key)
+            entries.append((entry[dn_key], attrs))
+
+        entries.sort(key=lambda entry: self.dn_sort_key(entry[0]))
+
+        return '\n'.join(self.render_entry(dn, attrs) for (dn, attrs) in entries)
+
+    def render_entry(self, dn, attrs):
+        lines = [self.render_line('dn', dn)]
+
+        names = sorted(attrs, key=lambda name: (name.lower() != 'objectclass', name.lower()))
+        for name in names:
+            values = attrs[name]
+            if values is None:
+                continue
+            if not isinstance(values, list):
+                values = [values]
+
+            for value in values:
+                if value is not None:
+                    lines.append(self.render_line(name, self.to_string(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def render_line(self, name, value):
+        """ Render an attribute line, base64-encoded when needed (RFC 2849). """
+        if self.needs_base64(value):
+            line = name + ':: ' + base64.b64encode(value.encode('utf-8')).decode('ascii')
+        else:
+            line = name + ': ' + value
+
+        # Fold the lines longer than 76 characters
+        folded = [line[:76]]
+        for idx in range(76, len(line), 75):
+            folded.append(' ' + line[idx:idx + 75])
+
+        return '\n'.join(folded)
+
+    def needs_base64(self, value):
+        if not value:
+            return False
+        if value[0] in [' ', ':', '<'] or value[-1] == ' ':
+            return True
+
+        return any(c in ['\0', '\n', '\r'] or ord(c) > 127 for c in value)
+
+    def to_string(self, value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        elif isinstance(value, string_types):
+            return value
+
+        return str(value)
+
+    def dn_sort_key(self, dn):
+        """ Sort the parents before their children, then by reversed dn. """
+        rdns = [rdn.strip().lower() for rdn in re.split(r'(?<!\\),', dn)]
+        rdns.reverse()
+
+        return (len(rdns), rdns)
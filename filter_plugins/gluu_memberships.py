@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+DOCUMENTATION = '''
+---
+filter: gluu_memberships
+author: "Guillaume Smaha"
+short_description: Build the group membership relation from the groups and the users
+description:
+Build a single relation, the dn of each group with the dns of its members, from the `member`
+list of the groups and the `memberOf` list of the users. A membership declared on either side
+is kept. Only the groups and users with an `inum` are used, and a group is only in the relation
+when it has a `member` list or when a user is member of it.
+The relation is used by the ldap_membership module to maintain `member` and `memberOf` together.
+author:
+  - Guillaume Smaha
+options:
+    name: users
+        required: true
+        description: List of the users (gluu_users)
+    name: base_inum
+        required: true
+        description: Inum of the organization
+filter: gluu_remove_keys
+short_description: Remove keys from a dict
+options:
+    name: keys
+        required: true
+        description: List of the keys to remove
+'''
+
+EXAMPLES = '''
+---
+gluu_groups:
+  - inum: '0010'
+    member:
+      - '0000.1111.0010'
+gluu_users:
+  - inum: '0000.1111.0020'
+    memberOf:
+      - '0010'
+
+- hosts: localhost
+  tasks:
+    - name: Print a message
+      debug:
+        msg: "{{ gluu_groups | gluu_memberships(gluu_users, base_inum='@!1111') }}"
+
+"inum=@!1111!0003!0010,ou=groups,o=@!1111,o=gluu":
+  - "inum=@!1111!0000!0000.1111.0010,ou=people,o=@!1111,o=gluu"
+  - "inum=@!1111!0000!0000.1111.0020,ou=people,o=@!1111,o=gluu"
+
+
+
+gluu_user:
+  uid: myUser
+  memberOf:
+    - '0010'
+
+- hosts: localhost
+  tasks:
+    - name: Print a message
+      debug:
+        msg: "{{ gluu_user | gluu_remove_keys(['memberOf']) }}"
+
+uid: myUser
+
+'''
+
+from ansible import errors
+
+
+class FilterModule(object):
+    def filters(self):
+        return {
+            'gluu_memberships': self.gluu_memberships,
+            'gluu_remove_keys': self.gluu_remove_keys,
+        }
+
+    def render(self, base_inum, inum_type, value, dn):
+        return 'inum=' + base_inum + '!' + inum_type + '!' + value + ',ou=' + dn + ',o=' + base_inum + ',o=gluu'
+
+    def gluu_memberships(self, groups, users=None, base_inum='', *args, **kw):
+        if not base_inum:
+            raise errors.AnsibleFilterError(
+                '[gluu_memberships] base_inum is required.')
+
+        relation = {}
+
+        for group in groups or []:
+            if 'inum' not in group or 'member' not in group:
+                continue
+
+            members = relation.setdefault(
+                self.render(base_inum, '0003', group['inum'], 'groups'), set())
+            for inum in self.to_list(group['member']):
+                members.add(self.render(base_inum, '0000', inum, 'people'))
+
+        for user in users or []:
+            if 'inum' not in user or 'memberOf' not in user:
+                continue
+
+            member = self.render(base_inum, '0000', user['inum'], 'people')
+            for inum in self.to_list(user['memberOf']):
+                relation.setdefault(
+                    self.render(base_inum, '0003', inum, 'groups'), set()).add(member)
+
+        return dict((group, sorted(members)) for (group, members) in relation.items())
+
+    def gluu_remove_keys(self, content, keys=None, *args, **kw):
+        if not isinstance(content, dict):
+            raise errors.AnsibleFilterError(
+                '[gluu_remove_keys] Input must be a dict.')
+
+        return dict((k, v) for (k, v) in content.items() if k not in (keys or []))
+
+    def to_list(self, value):
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return value
+
+        return [value]
@@ -23,6 +23,12 @@ options:
     name: ignore_notfound
         required: false
         description: Ignore error if key is not found
+    name: salt_seed
+        required: false
+        description:
+            - Secret used to derive the salt from the password and the inum (or uid) of the entry.
+              By default, the salt is random. With a seed, the same password always gives the same hash,
+              so the rendered entries are deterministic and an existing password is not rewritten.
 '''
 
 EXAMPLES = '''
@@ -38,6 +44,9 @@ EXAMPLES = '''
     - name: Encrypt password
       {{ password | gluu_ssha_user_password(
           key='key_to_crypt') }}
+    - name: Encrypt password on user with a deterministic salt
+      {{ user | gluu_ssha_user_password(
+          key='password', salt_seed='secret_seed') }}
 '''
 
 
@@ -54,33 +63,41 @@ class FilterModule(object):
             'gluu_ssha_user_password': self.gluu_ssha_user_password
         }
 
-    def gluu_ssha_user_password(self, content, key=None, ignore_notfound=False, *args, **kw):
+    def gluu_ssha_user_password(self, content, key=None, ignore_notfound=False, salt_seed=None, *args, **kw):
 
         if isinstance(content, dict):
-            return self.gluu_ssha_user_password_dict(content, key, ignore_notfound)
+            return self.gluu_ssha_user_password_dict(content, key, ignore_notfound, salt_seed)
         elif isinstance(content, string_types):
-            return self.gluu_ssha_user_password_str(content)
+            return self.gluu_ssha_user_password_str(content, salt_seed)
 
         return content
 
-    def gluu_ssha_user_password_dict(self, content, key, ignore_notfound):
+    def gluu_ssha_user_password_dict(self, content, key, ignore_notfound, salt_seed):
         if key not in content:
             if ignore_notfound:
                 return content
             raise errors.AnsibleFilterError(
                 '[gluu_ssha_user_password] key is required for an input dict.')
 
-        content[key] = self.encrypt(content[key])
+        context = content.get('inum') or content.get('uid') or ''
+        content[key] = self.encrypt(content[key], salt_seed, context)
 
         return content
 
-    def gluu_ssha_user_password_str(self, content):
+    def gluu_ssha_user_password_str(self, content, salt_seed):
+
+        return self.encrypt(content, salt_seed)
+
+    def salt(self, password, salt_seed, context):
+        if not salt_seed:
+            return os.urandom(4)
 
-        return self.encrypt(content)
+        seed = '%s!%s!' % (salt_seed, context)
+        return hashlib.sha1(seed.encode('utf-8') + password).digest()[:4]
 
-    def encrypt(self, password):
+    def encrypt(self, password, salt_seed=None, context=''):
         password = password.encode('ascii')
-        salt = os.urandom(4)
+        salt = self.salt(password, salt_seed, context)
         sha_password = hashlib.sha1(password)
         sha_password.update(salt)
         sha_digest = sha_password.digest()
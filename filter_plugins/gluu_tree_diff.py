@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+DOCUMENTATION = '''
+---
+filter: gluu_tree_diff
+author: "Guillaume Smaha"
+short_description: Compare the hash trees of several LDAP servers
+description:
+Compare the children hashes returned by the ldap_tree_hash module on several nodes and return the
+sorted list of the children whose hash differs or which are missing on a node.
+The result is the list of paths to expand in the next call of ldap_tree_hash, or the divergent dns
+at the last level.
+author:
+  - Guillaume Smaha
+'''
+
+EXAMPLES = '''
+---
+gluu_trees:
+  - "": {"ou=people,o=gluu": "aaa", "ou=groups,o=gluu": "bbb"}
+  - "": {"ou=people,o=gluu": "aaa", "ou=groups,o=gluu": "ccc"}
+
+- hosts: localhost
+  tasks:
+    - name: Print a message
+      debug:
+        msg: "{{ gluu_trees | gluu_tree_diff }}"
+
+["ou=groups,o=gluu"]
+
+'''
+
+from ansible import errors
+
+
+class FilterModule(object):
+    def filters(self):
+        return {
+            'gluu_tree_diff': self.gluu_tree_diff
+        }
+
+    def gluu_tree_diff(self, trees, *args, **kw):
+        if not isinstance(trees, list):
+            raise errors.AnsibleFilterError(
+                '[gluu_tree_diff] Input must be a list of children hashes.')
+
+        paths = set()
+        for tree in trees:
+            paths.update((tree or {}).keys())
+
+        differ = set()
+        for path in paths:
+            nodes = [(tree or {}).get(path, {}) for tree in trees]
+            children = set()
+            for node in nodes:
+                children.update(node.keys())
+
+            for child in children:
+                if len(set(node.get(child) for node in nodes)) > 1:
+                    differ.add(child)
+
+        return sorted(differ)
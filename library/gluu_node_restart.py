@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+
+DOCUMENTATION = """
+---
+module: gluu_node_restart
+short_description: Restart a Gluu node and wait until it is healthy.
+description:
+  - Run the restart command of a Gluu node, then wait until the OpenID
+    configuration of oxAuth answers and the LDAP port accepts connections,
+    both within their latency thresholds, for I(healthy_checks) checks in
+    a row.
+  - Report the time of the restart, the time waited and the downtime of the
+    node.
+author:
+  - Guillaume Smaha
+options:
+  command:
+    required: false
+    default: null
+    description:
+      - Restart command of the node. Without it, the module only waits.
+  url:
+    required: true
+    description:
+      - URL of the OpenID configuration of oxAuth on the node.
+  validate_certs:
+    required: false
+    choices: ['yes', 'no']
+    default: 'no'
+    description:
+      - If C(no), SSL certificates of I(url) will not be validated.
+  ldap_host:
+    required: false
+    default: localhost
+    description:
+      - Host of the LDAP server of the node.
+  ldap_port:
+    required: false
+    default: 1636
+    description:
+      - Port of the LDAP server of the node. Set to 0 to skip the check.
+  max_latency:
+    required: false
+    default: 2000
+    description:
+      - Maximum latency, in milliseconds, of the OpenID configuration.
+  ldap_max_latency:
+    required: false
+    default: 500
+    description:
+      - Maximum latency, in milliseconds, of a connection to the LDAP port.
+  healthy_checks:
+    required: false
+    default: 3
+    description:
+      - Number of healthy checks in a row to consider the node healthy.
+  interval:
+    required: false
+    default: 2
+    description:
+      - Seconds between two checks.
+  timeout:
+    required: false
+    default: 600
+    description:
+      - Maximum number of seconds to wait for the node to be healthy.
+"""
+
+
+EXAMPLES = """
+- name: Restart the node
+  gluu_node_restart:
+    command: gluu-serverd-3.1.7 restart
+    url: https://gluu.example.com/.well-known/openid-configuration
+
+- name: Wait for the node without restarting it
+  gluu_node_restart:
+    url: https://gluu.example.com/.well-known/openid-configuration
+    healthy_checks: 1
+"""
+
+
+RETURN = """
+restart_time:
+  description: Seconds taken by the restart command.
+  returned: when command is set
+  type: float
+wait_time:
+  description: Seconds waited for the node to be healthy.
+  returned: success
+  type: float
+downtime:
+  description:
+    - Seconds from the start of the restart until the first of the healthy
+      checks in a row.
+  returned: success
+  type: float
+latency:
+  description: Latency in milliseconds of the last checks.
+  returned: success
+  type: dict
+  sample: '{"http": 35.1, "ldap": 0.4}'
+"""
+
+import json
+import socket
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.urls import open_url
+
+
+class NodeHealth(object):
+    def __init__(self, module):
+        # Shortcuts
+        self.module = module
+        self.url = self.module.params['url']
+        self.validate_certs = self.module.params['validate_certs']
+        self.ldap_host = self.module.params['ldap_host']
+        self.ldap_port = self.module.params['ldap_port']
+        self.max_latency = self.module.params['max_latency']
+        self.ldap_max_latency = self.module.params['ldap_max_latency']
+
+        self.latency = {}
+        self.error = None
+
+    def check(self):
+        """ Return True if the node answers within the latency thresholds. """
+        self.latency = {}
+
+        start = time.time()
+        try:
+            response = open_url(
+                self.url, validate_certs=self.validate_certs,
+                timeout=self.max_latency / 1000.0)
+            json.loads(response.read())
+        except Exception:
+            e = get_exception()
+            self.error = 'oxAuth: %s' % e
+            return False
+        self.latency['http'] = round((time.time() - start) * 1000, 1)
+
+        if self.ldap_port:
+            start = time.time()
+            try:
+                sock = socket.create_connection(
+                    (self.ldap_host, self.ldap_port),
+                    timeout=self.ldap_max_latency / 1000.0)
+                sock.close()
+            except (socket.error, socket.timeout):
+                e = get_exception()
+                self.error = 'LDAP: %s' % e
+                return False
+            self.latency['ldap'] = round((time.time() - start) * 1000, 1)
+
+        if self.latency['http'] > self.max_latency:
+            self.error = 'oxAuth latency %sms' % self.latency['http']
+            return False
+        if self.latency.get('ldap', 0) > self.ldap_max_latency:
+            self.error = 'LDAP latency %sms' % self.latency['ldap']
+            return False
+
+        self.error = None
+        return True
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'command': dict(),
+            'url': dict(required=True),
+            'validate_certs': dict(default=False, type='bool'),
+            'ldap_host': dict(default='localhost'),
+            'ldap_port': dict(default=1636, type='int'),
+            'max_latency': dict(default=2000, type='int'),
+            'ldap_max_latency': dict(default=500, type='int'),
+            'healthy_checks': dict(default=3, type='int'),
+            'interval': dict(default=2, type='int'),
+            'timeout': dict(default=600, type='int'),
+        },
+        supports_check_mode=True,
+    )
+
+    if module.check_mode:
+        module.exit_json(changed=module.params['command'] is not None)
+
+    result = dict(changed=False)
+    start = time.time()
+
+    if module.params['command']:
+        rc, out, err = module.run_command(module.params['command'])
+        if rc != 0:
+            module.fail_json(
+                msg="Restart command failed.", rc=rc, stdout=out, stderr=err)
+        result['changed'] = True
+        result['restart_time'] = round(time.time() - start, 3)
+
+    health = NodeHealth(module)
+    healthy_checks = max(1, module.params['healthy_checks'])
+    wait_start = time.time()
+    healthy = 0
+    healthy_since = None
+
+    while healthy < healthy_checks:
+        if time.time() - wait_start > module.params['timeout']:
+            module.fail_json(
+                msg="Node is not healthy after %d seconds." % module.params['timeout'],
+                details=health.error, **result)
+
+        check_start = time.time()
+        if health.check():
+            # The node is back since the first check of the series
+            if healthy == 0:
+                healthy_since = check_start
+            healthy += 1
+        else:
+            healthy = 0
+
+        if healthy < healthy_checks:
+            time.sleep(module.params['interval'])
+
+    result['wait_time'] = round(time.time() - wait_start, 3)
+    result['downtime'] = round(healthy_since - start, 3)
+    result['latency'] = health.latency
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
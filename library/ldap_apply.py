@@ -0,0 +1,450 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+
+DOCUMENTATION = """
+---
+module: ldap_apply
+short_description: Apply a plan of LDAP changes.
+description:
+  - Send the changes recorded in a plan by C(ldap_upsert) and
+    C(ldap_attr_custom) with I(plan_file), in order, without reading the
+    entries again.
+  - The writes are pipelined on a single connection. A change is only sent
+    once the pending changes of the same entry, of its parent and of the
+    entries referenced by its values have completed.
+  - In check mode, the server is not contacted and the plan is only
+    summarized.
+notes:
+  - The plan is applied as it was computed. An entry changed on the server
+    since the plan has been computed may make a change fail, in which case
+    the changes sent before are kept and the module fails.
+author:
+  - Guillaume Smaha
+requirements:
+  - python-ldap
+options:
+  bind_dn:
+    required: false
+    default: null
+    description:
+      - A DN to bind with. If this is omitted, we'll try a SASL bind with
+        the EXTERNAL mechanism. If this is blank, we'll use an anonymous
+        bind.
+  bind_pw:
+    required: false
+    default: null
+    description:
+      - The password to use with I(bind_dn).
+  params:
+    required: false
+    default: null
+    description:
+      - List of options which allows to overwrite any of the task options.
+  plan:
+    required: true
+    description:
+      - Path of the plan on the managed host.
+  pipeline:
+    required: false
+    default: 16
+    description:
+      - Maximum number of writes sent without waiting for their result.
+  parallel:
+    required: false
+    default: 1
+    description:
+      - Number of connections writing at the same time. With more than one
+        connection, the changes are scheduled from a dependency graph: a
+        change waits for the previous changes of the plan on the same entry,
+        on its parent, and on the entries referenced by its values (for
+        example C(oxAuthScope), C(member) or C(memberOf)). Independent
+        changes, like scripts and users, are written concurrently.
+      - I(pipeline) only applies to a single connection.
+  parallel_timeout:
+    required: false
+    default: 3600
+    description:
+      - Maximum number of seconds to wait for the connections writing in
+        parallel to complete the plan, after which the module fails.
+  result_format:
+    required: false
+    choices: [full, summary, counts]
+    default: summary
+    description:
+      - Format of the I(changes) returned in check mode.
+  result_max_bytes:
+    required: false
+    default: 1048576
+    description:
+      - Maximum size of the I(changes) returned in check mode.
+  result_spill_path:
+    required: false
+    default: null
+    description:
+      - File on the managed host where the whole I(changes) is written when
+        it is larger than I(result_max_bytes).
+  server_uri:
+    required: false
+    default: ldapi:///
+    description:
+      - A URI to the LDAP server. The default value lets the underlying
+        LDAP client library look for a UNIX domain socket in its default
+        location.
+  start_tls:
+    required: false
+    choices: ['yes', 'no']
+    default: 'no'
+    description:
+      - If true, we'll use the START_TLS LDAP extension.
+  validate_certs:
+    required: false
+    choices: ['yes', 'no']
+    default: 'yes'
+    description:
+      - If C(no), SSL certificates will not be validated. This should only be
+        used on sites using self-signed certificates.
+"""
+
+
+EXAMPLES = """
+- name: Compute the changes
+  ldap_upsert:
+    params: "{{ ldap_auth }}"
+    dn: ou=users,dc=example,dc=com
+    plan_file: /root/gluu-plan.jsonl
+    attributes:
+      objectClass: organizationalUnit
+
+- name: Show the changes of the plan
+  ldap_apply:
+    plan: /root/gluu-plan.jsonl
+  check_mode: yes
+
+- name: Apply the changes of the plan
+  ldap_apply:
+    params: "{{ ldap_auth }}"
+    plan: /root/gluu-plan.jsonl
+
+- name: Apply the independent changes of the plan concurrently
+  ldap_apply:
+    params: "{{ ldap_auth }}"
+    plan: /root/gluu-plan.jsonl
+    parallel: 4
+"""
+
+
+RETURN = """
+counts:
+  description: Number of entries added and modified.
+  returned: success
+  type: dict
+  sample: '{"add": 1, "modify": 3}'
+changes:
+  description: Changes of the plan, by dn.
+  returned: in check mode, unless result_format is counts
+  type: dict
+"""
+
+import threading
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.six.moves import queue
+from ansible.module_utils.gluu_ldap_plan import Plan, decode_change
+from ansible.module_utils.gluu_ldap_schema import to_text
+from ansible.module_utils.gluu_ldap_result import (
+    RESULT_FORMATS, bound_result, summarize_modlist, to_json_safe)
+
+try:
+    import ldap
+    import ldap.dn
+    import ldap.sasl
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+def parent_dn(dn):
+    """ Return the lowercased dn of the parent of dn. """
+    try:
+        rdns = ldap.dn.explode_dn(dn)
+    except ldap.DECODING_ERROR:
+        return ''
+
+    return ','.join(rdns[1:]).lower()
+
+
+def referenced_dns(dn, modlist):
+    """ Return the lowercased dns a change has to be written after: the
+        entry itself, its parent and the entries referenced by its values. """
+    referenced = set([dn.lower(), parent_dn(dn)])
+    for mod in modlist:
+        for value in mod[-1] or []:
+            referenced.add(to_text(value).lower())
+
+    return referenced
+
+
+def build_dependencies(changes):
+    """ Return, for each change, the indexes of the changes it depends on.
+
+    A change depends on the last previous change of the same entry, of its
+    parent and of every entry referenced by one of its values. Only the
+    previous changes of the plan are considered, so the graph has no cycle
+    and the order of the plan is kept between dependent changes.
+    """
+    last_write = {}
+    dependencies = []
+
+    for (index, (dn, operation, modlist)) in enumerate(changes):
+        dependencies.append(set(
+            last_write[ref] for ref in referenced_dns(dn, modlist)
+            if ref in last_write))
+        last_write[dn.lower()] = index
+
+    return dependencies
+
+
+class PlanApplier(object):
+    def __init__(self, module):
+        # Shortcuts
+        self.module = module
+        self.server_uri = self.module.params['server_uri']
+        self.bind_dn = self.module.params['bind_dn']
+        self.bind_pw = self.module.params['bind_pw']
+        self.start_tls = self.module.params['start_tls']
+        self.verify_cert = self.module.params['validate_certs']
+        self.pipeline = max(1, self.module.params['pipeline'])
+
+        # Establish connection
+        self.connection = self._connect_to_ldap()
+
+        # Writes sent and not yet completed, by msgid and by dn
+        self.pending = {}
+        self.pending_dns = {}
+
+    def apply(self, changes, counts):
+        for (dn, operation, modlist) in changes:
+            # Keep the order of the writes of an entry, of its parent and of
+            # the entries it references
+            referenced = referenced_dns(dn, modlist)
+            while self.pending and (
+                    len(self.pending) >= self.pipeline or
+                    not referenced.isdisjoint(self.pending_dns)):
+                self._wait()
+
+            if operation == 'add':
+                msgid = self.connection.add_ext(dn, modlist)
+            else:
+                msgid = self.connection.modify_ext(dn, modlist)
+
+            self.pending[msgid] = (dn, operation)
+            self.pending_dns[dn.lower()] = msgid
+            counts[operation] += 1
+
+        while self.pending:
+            self._wait()
+
+    def _wait(self):
+        """ Wait for the result of any of the pending writes. """
+        try:
+            msgid = self.connection.result3(ldap.RES_ANY, all=1)[2]
+        except ldap.LDAPError:
+            e = get_exception()
+            info = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+            (dn, operation) = self.pending.get(info.get('msgid'), (None, None))
+            self.module.fail_json(
+                msg="Plan action failed.", details=str(e), dn=dn,
+                operation=operation)
+
+        (dn, operation) = self.pending.pop(msgid)
+        if self.pending_dns.get(dn.lower()) == msgid:
+            del self.pending_dns[dn.lower()]
+
+    def apply_parallel(self, changes, counts, parallel, timeout):
+        """ Write the changes over a pool of connections, as soon as the
+            changes they depend on are written. """
+        dependencies = build_dependencies(changes)
+        dependents = [[] for change in changes]
+        remaining = [len(deps) for deps in dependencies]
+        for (index, deps) in enumerate(dependencies):
+            for dep in deps:
+                dependents[dep].append(index)
+
+        connections = [self.connection] + [
+            self._connect_to_ldap() for i in range(parallel - 1)]
+
+        ready = queue.Queue()
+        lock = threading.Lock()
+        state = {'done': 0, 'error': None}
+
+        for (index, count) in enumerate(remaining):
+            if count == 0:
+                ready.put(index)
+
+        def stop():
+            for connection in connections:
+                ready.put(None)
+
+        def worker(connection):
+            while True:
+                index = ready.get()
+                if index is None:
+                    return
+
+                (dn, operation, modlist) = changes[index]
+                try:
+                    if operation == 'add':
+                        connection.add_s(dn, modlist)
+                    else:
+                        connection.modify_s(dn, modlist)
+                except Exception:
+                    # Any error, not only LDAPError, must release the other
+                    # workers waiting for a change
+                    e = get_exception()
+                    with lock:
+                        if state['error'] is None:
+                            state['error'] = (dn, operation, str(e))
+                            stop()
+                    return
+
+                with lock:
+                    counts[operation] += 1
+                    state['done'] += 1
+                    for dependent in dependents[index]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            ready.put(dependent)
+                    if state['done'] == len(changes):
+                        stop()
+
+        threads = [
+            threading.Thread(target=worker, args=(connection,))
+            for connection in connections]
+        for thread in threads:
+            # A worker still blocked at the timeout does not keep the module
+            thread.daemon = True
+            thread.start()
+
+        deadline = time.time() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+
+        if any(thread.is_alive() for thread in threads):
+            with lock:
+                stop()
+            self.module.fail_json(
+                msg="Plan not applied within %d seconds." % timeout,
+                counts=counts)
+
+        if state['error'] is not None:
+            (dn, operation, details) = state['error']
+            self.module.fail_json(
+                msg="Plan action failed.", details=details, dn=dn,
+                operation=operation, counts=counts)
+
+    def _connect_to_ldap(self):
+        if not self.verify_cert:
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+
+        connection = ldap.initialize(self.server_uri)
+
+        if self.start_tls:
+            try:
+                connection.start_tls_s()
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(msg="Cannot start TLS.", details=str(e))
+
+        try:
+            if self.bind_dn is not None:
+                connection.simple_bind_s(self.bind_dn, self.bind_pw)
+            else:
+                connection.sasl_interactive_bind_s('', ldap.sasl.external())
+        except ldap.LDAPError:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Cannot bind to the server.", details=str(e))
+
+        return connection
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'bind_dn': dict(default=None),
+            'bind_pw': dict(default='', no_log=True),
+            'params': dict(type='dict'),
+            'plan': dict(required=True, type='path'),
+            'pipeline': dict(default=16, type='int'),
+            'parallel': dict(default=1, type='int'),
+            'parallel_timeout': dict(default=3600, type='int'),
+            'result_format': dict(default='summary', choices=RESULT_FORMATS),
+            'result_max_bytes': dict(default=1048576, type='int'),
+            'result_spill_path': dict(type='path'),
+            'server_uri': dict(default='ldapi:///'),
+            'start_tls': dict(default=False, type='bool'),
+            'validate_certs': dict(default=True, type='bool'),
+        },
+        supports_check_mode=True,
+    )
+
+    if not HAS_LDAP:
+        module.fail_json(
+            msg="Missing required 'ldap' module (pip install python-ldap)")
+
+    # Update module parameters with user's parameters if defined
+    if 'params' in module.params and isinstance(module.params['params'], dict):
+        module.params.update(module.params['params'])
+        # Remove the params
+        module.params.pop('params', None)
+
+    try:
+        changes = [decode_change(r) for r in Plan(module.params['plan']).records()]
+    except (IOError, OSError, ValueError, KeyError):
+        e = get_exception()
+        module.fail_json(msg="Cannot read the plan.", details=str(e))
+
+    counts = {'add': 0, 'modify': 0}
+
+    # Only summarize the plan, without contacting the server
+    if module.check_mode:
+        result = {}
+        for (dn, operation, modlist) in changes:
+            counts[operation] += 1
+            if module.params['result_format'] == 'summary':
+                result[dn] = summarize_modlist(operation, modlist)
+            elif module.params['result_format'] == 'full':
+                result[dn] = to_json_safe(
+                    {'operation': operation, 'modlist': modlist})
+
+        output = dict(changed=bool(changes), counts=counts)
+        if module.params['result_format'] != 'counts':
+            output['changes'], extra = bound_result(
+                result, module.params['result_max_bytes'],
+                module.params['result_spill_path'])
+            output.update(extra)
+
+        module.exit_json(**output)
+
+    if changes and module.params['parallel'] > 1:
+        PlanApplier(module).apply_parallel(
+            changes, counts, module.params['parallel'],
+            module.params['parallel_timeout'])
+    elif changes:
+        PlanApplier(module).apply(changes, counts)
+
+    module.exit_json(changed=bool(changes), counts=counts)
+
+
+if __name__ == '__main__':
+    main()
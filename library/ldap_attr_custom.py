@@ -40,11 +40,10 @@ notes:
     a simple bind to access your server, pass the credentials in I(bind_dn)
     and I(bind_pw).
   - For I(state=present) and I(state=absent), all value comparisons are
-    performed on the server for maximum accuracy. For I(state=exact), values
-    have to be compared in Python, which obviously ignores LDAP matching
-    rules. This should work out in most cases, but it is theoretically
-    possible to see spurious changes when target and actual values are
-    semantically identical but lexically distinct.
+    performed on the server for maximum accuracy. For I(state=exact) and for
+    the I(attributes) mode, values are compared in Python with the equality
+    matching rule of each attribute, read from the schema of the server.
+    Attribute names are matched case-insensitively and with their aliases.
 version_added: '2.3'
 author:
   - Jiri Tyr (@jtyr)
@@ -68,9 +67,20 @@ options:
     description:
       - The DN of the entry to modify.
   name:
-    required: true
+    required: false
+    description:
+      - The name of the attribute to modify. Either I(name) or I(attributes)
+        must be provided.
+  attributes:
+    required: false
     description:
-      - The name of the attribute to modify.
+      - A dict of attribute names to modify at once. Each value is either
+        the value(s) of the attribute, in which case I(state) is used, or a
+        dict with the keys C(values) and C(state) to set a per-attribute
+        state.
+      - All the attributes are read with one search and all the changes are
+        applied with a single atomic modify operation.
+      - In this mode, the values are compared in Python for every state.
   server_uri:
     required: false
     default: ldapi:///
@@ -96,11 +106,11 @@ options:
         I(state=exact) and I(value) is empty, all values for this
         attribute will be removed.
   values:
-    required: true
+    required: false
     description:
       - The value(s) to add or remove. This can be a string or a list of
         strings. The complex argument format is required in order to pass
-        a list of strings (see examples).
+        a list of strings (see examples). Required with I(name).
   validate_certs:
     required: false
     choices: ['yes', 'no']
@@ -109,6 +119,39 @@ options:
       - If C(no), SSL certificates will not be validated. This should only be
         used on sites using self-signed certificates.
     version_added: "2.4"
+  validate_schema:
+    required: false
+    choices: ['yes', 'no']
+    default: 'yes'
+    description:
+      - If C(yes), the attributes are validated against the schema of the
+        server (known and single-valued attributes) before any write is sent.
+  schema_cache:
+    required: false
+    default: ~/.ansible/cache/ldap_schema
+    description:
+      - Directory on the managed host where the subschema of the server is
+        cached. The cache is keyed by the server and the modifyTimestamp of
+        the subschema entry. Set to an empty string to disable the cache.
+  revision_attribute:
+    required: false
+    default: null
+    description:
+      - Attribute holding the revision of the entry, like C(oxRevision).
+        It is increased by one with each modification of the entry, and
+        only then, unless the modification sets it.
+  plan_file:
+    required: false
+    default: null
+    description:
+      - Append the modification to this plan on the managed host instead of
+        performing it, to send it later with C(ldap_apply).
+  trace_file:
+    required: false
+    default: null
+    description:
+      - File on the managed host where a JSON line is appended for each
+        LDAP operation, with its type, target and duration.
 """
 
 
@@ -157,6 +200,19 @@ EXAMPLES = """
     olcRootDN: cn=root,dc=example,dc=com
     olcRootPW: "{SSHA}tabyipcHzhwESzRaGA7oQ/SDoBZQOGND"
 
+- name: Set up a root user and declare indexes with a single modification
+  ldap_attr_custom:
+    dn: olcDatabase={1}hdb,cn=config
+    state: exact
+    attributes:
+      olcRootDN: cn=root,dc=example,dc=com
+      olcRootPW: "{SSHA}tabyipcHzhwESzRaGA7oQ/SDoBZQOGND"
+      olcDbIndex:
+        values:
+          - objectClass eq
+          - uid eq
+        state: present
+
 - name: Get rid of an unneeded attribute
   ldap_attr_custom:
     dn: uid=jdoe,ou=people,dc=example,dc=com
@@ -191,10 +247,23 @@ modlist:
   returned: success
   type: list
   sample: '[[2, "olcRootDN", ["cn=root,dc=example,dc=com"]]]'
+stats:
+  description:
+    - Number, total, p50, p95 and max milliseconds of each type of LDAP
+      operation (connect, bind, search, compare, add, modify). The
+      connection to the server is opened by the first operation, usually the
+      bind, and counted in its time.
+  returned: when connected to the server
+  type: dict
+  sample: '{"search": {"count": 3, "total": 4.2, "p50": 1.1, "p95": 2.5, "max": 2.5}}'
 """
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.gluu_ldap_plan import Plan
+from ansible.module_utils.gluu_ldap_revision import revision_modlist
+from ansible.module_utils.gluu_ldap_schema import LdapSchema
+from ansible.module_utils.gluu_ldap_stats import LdapStats
 
 try:
     import ldap
@@ -217,16 +286,26 @@ class LdapAttr(object):
         self.start_tls = self.module.params['start_tls']
         self.state = self.module.params['state']
         self.verify_cert = self.module.params['validate_certs']
+        self.schema_cache = self.module.params['schema_cache']
 
         # Normalize values
-        if isinstance(self.module.params['values'], list):
-            self.values = map(str, self.module.params['values'])
+        if self.module.params['attributes']:
+            self.values = []
+            self.attributes = self._load_attributes()
         else:
-            self.values = [str(self.module.params['values'])]
+            self.values = self._normalize_values(self.module.params['values'])
+            self.attributes = None
+
+        # Time the operations sent to the server
+        self.stats = LdapStats(self.module.params['trace_file'])
 
         # Establish connection
         self.connection = self._connect_to_ldap()
 
+        # Load the schema to compare attributes with the server rules
+        self.schema = LdapSchema.from_connection(
+            self.connection, self.server_uri, self.schema_cache)
+
     def add(self):
         values_to_add = filter(self._is_value_absent, self.values)
 
@@ -248,27 +327,111 @@ class LdapAttr(object):
         return modlist
 
     def exact(self):
+        current = self.schema.get_values(
+            self._search_attrs([self.name]), self.name)
+
+        return self._exact_modlist(self.name, self.values, current)
+
+    def multi(self):
+        """ Compute a single modlist for all the I(attributes). """
+        current = self._search_attrs([attr[0] for attr in self.attributes])
+        modlist = []
+
+        for (name, values, state) in self.attributes:
+            current_values = self.schema.get_values(current, name)
+
+            if state == 'present':
+                values_to_add = self.schema.missing_values(
+                    name, values, current_values)
+                if len(values_to_add) > 0:
+                    modlist.append((ldap.MOD_ADD, name, values_to_add))
+            elif state == 'absent':
+                values_to_delete = self.schema.present_values(
+                    name, values, current_values)
+                if len(values_to_delete) > 0:
+                    modlist.append((ldap.MOD_DELETE, name, values_to_delete))
+            else:
+                modlist.extend(
+                    self._exact_modlist(name, values, current_values))
+
+        return modlist
+
+    def revision(self, modlist):
+        """ Return the modification increasing the revision of the entry, so
+            oxAuth and oxTrust reload it without a restart. """
+        name = self.module.params['revision_attribute']
+        if not name or any(op[1].lower() == name.lower() for op in modlist):
+            return []
+
+        return revision_modlist(
+            name, self.schema.get_values(self._search_attrs([name]), name))
+
+    def validate(self):
+        """ Return the schema violations of the attributes to write. """
+        errors = []
+
+        if self.attributes is not None:
+            for (name, values, state) in self.attributes:
+                if state != 'absent':
+                    errors.extend(self.schema.validate_attribute(name, values))
+        elif self.state != 'absent':
+            errors.extend(self.schema.validate_attribute(self.name, self.values))
+
+        return errors
+
+    def _exact_modlist(self, name, values, current):
+        modlist = []
+
+        if not self.schema.same_values(name, values, current):
+            if len(current) == 0:
+                modlist = [(ldap.MOD_ADD, name, values)]
+            elif len(values) == 0:
+                modlist = [(ldap.MOD_DELETE, name, None)]
+            else:
+                modlist = [(ldap.MOD_REPLACE, name, values)]
+
+        return modlist
+
+    def _search_attrs(self, names):
+        """ Return the current values of the given attributes. """
         try:
             results = self.connection.search_s(
-                self.dn, ldap.SCOPE_BASE, attrlist=[self.name])
+                self.dn, ldap.SCOPE_BASE, attrlist=names)
         except ldap.LDAPError:
             e = get_exception()
             self.module.fail_json(
-                msg="Cannot search for attribute %s" % self.name,
+                msg="Cannot search for attributes %s" % ', '.join(names),
                 details=str(e))
 
-        current = results[0][1].get(self.name, [])
-        modlist = []
+        return results[0][1]
 
-        if frozenset(self.values) != frozenset(current):
-            if len(current) == 0:
-                modlist = [(ldap.MOD_ADD, self.name, self.values)]
-            elif len(self.values) == 0:
-                modlist = [(ldap.MOD_DELETE, self.name, None)]
-            else:
-                modlist = [(ldap.MOD_REPLACE, self.name, self.values)]
+    def _load_attributes(self):
+        """ Turn I(attributes) into a list of (name, values, state). """
+        attributes = []
 
-        return modlist
+        for name, spec in sorted(self.module.params['attributes'].items()):
+            state = self.state
+            values = spec
+
+            if isinstance(spec, dict):
+                values = spec.get('values')
+                state = spec.get('state', self.state)
+
+            if state not in ['present', 'absent', 'exact']:
+                self.module.fail_json(
+                    msg="Invalid state %s for attribute %s" % (state, name))
+
+            attributes.append((name, self._normalize_values(values), state))
+
+        return attributes
+
+    def _normalize_values(self, values):
+        if values is None:
+            return []
+        elif isinstance(values, list):
+            return [str(v) for v in values]
+        else:
+            return [str(values)]
 
     def _is_value_present(self, value):
         """ True if the target attribute has the given value. """
@@ -288,7 +451,7 @@ class LdapAttr(object):
         if not self.verify_cert:
             ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
 
-        connection = ldap.initialize(self.server_uri)
+        connection = self.stats.initialize(self.server_uri)
 
         if self.start_tls:
             try:
@@ -316,16 +479,24 @@ def main():
             'bind_dn': dict(default=None),
             'bind_pw': dict(default='', no_log=True),
             'dn': dict(required=True),
-            'name': dict(required=True),
+            'name': dict(),
+            'attributes': dict(type='dict'),
             'params': dict(type='dict'),
+            'trace_file': dict(type='path'),
             'server_uri': dict(default='ldapi:///'),
             'start_tls': dict(default=False, type='bool'),
             'state': dict(
                 default='present',
                 choices=['present', 'absent', 'exact']),
-            'values': dict(required=True, type='raw'),
+            'values': dict(type='raw'),
             'validate_certs': dict(default=True, type='bool'),
+            'validate_schema': dict(default=True, type='bool'),
+            'schema_cache': dict(default='~/.ansible/cache/ldap_schema'),
+            'plan_file': dict(type='path'),
+            'revision_attribute': dict(),
         },
+        required_one_of=[['name', 'attributes']],
+        mutually_exclusive=[['name', 'attributes']],
         supports_check_mode=True,
     )
 
@@ -339,13 +510,25 @@ def main():
         # Remove the params
         module.params.pop('params', None)
 
+    if module.params['name'] and module.params['values'] is None:
+        module.fail_json(msg="values is required with name.")
+
     # Instantiate the LdapAttr object
     ldap = LdapAttr(module)
 
     state = module.params['state']
 
+    if module.params['validate_schema']:
+        errors = ldap.validate()
+        if errors:
+            module.fail_json(
+                msg="Attributes do not match the schema of the server.",
+                errors=errors)
+
     # Perform action
-    if state == 'present':
+    if ldap.attributes is not None:
+        modlist = ldap.multi()
+    elif state == 'present':
         modlist = ldap.add()
     elif state == 'absent':
         modlist = ldap.delete()
@@ -357,7 +540,15 @@ def main():
     if len(modlist) > 0:
         changed = True
 
-        if not module.check_mode:
+        # Only increase the revision when the content changed
+        modlist.extend(ldap.revision(modlist))
+
+        if module.params['plan_file']:
+            # Record the modification in the plan instead of performing it
+            if not module.check_mode:
+                Plan(module.params['plan_file']).append(
+                    ldap.dn, 'modify', modlist)
+        elif not module.check_mode:
             try:
                 ldap.connection.modify_s(ldap.dn, modlist)
             except Exception:
@@ -365,7 +556,7 @@ def main():
                 module.fail_json(
                     msg="Attribute action failed.", details=str(e))
 
-    module.exit_json(changed=changed, modlist=modlist)
+    module.exit_json(changed=changed, modlist=modlist, stats=ldap.stats.summary())
 
 
 if __name__ == '__main__':
@@ -84,6 +84,89 @@ options:
     description:
       - Define if the first is only returned.
         It is set to true when dn is defined
+  dest:
+    required: false
+    default: null
+    description:
+      - File on the managed host where the entries are written, page by page,
+        instead of being returned. Only I(count) and I(checksum) are returned.
+  dest_format:
+    required: false
+    choices: [jsonl, ldif]
+    default: null
+    description:
+      - Format of I(dest). Defaults to C(ldif) when I(dest) ends with
+        C(.ldif) or C(.ldif.gz), C(jsonl) otherwise.
+      - With C(jsonl), each line is an object with the keys C(dn) and
+        C(attributes). Values which are not valid UTF-8 are written
+        base64-encoded in the key C(base64).
+  compress:
+    required: false
+    choices: ['yes', 'no']
+    default: null
+    description:
+      - Compress I(dest) with gzip. Defaults to C(yes) when I(dest) ends
+        with C(.gz).
+  page_size:
+    required: false
+    default: 500
+    description:
+      - Number of entries requested per page with the simple paged results
+        control when writing to I(dest).
+  sync_state:
+    required: false
+    default: null
+    description:
+      - Local state file holding the high-water mark of the last successful
+        run. When it is set, only the entries changed since that run are
+        searched, with a C((modifyTimestamp>=X)) or C((entryCSN>=X)) filter.
+        The first run searches all the entries.
+      - Deleted entries are not reported.
+  sync_attribute:
+    required: false
+    choices: [auto, modifyTimestamp, entryCSN]
+    default: auto
+    description:
+      - Attribute of the high-water mark. With C(auto), C(entryCSN) is used
+        when the server exposes a C(contextCSN) on the search base, and
+        C(modifyTimestamp) otherwise.
+  sync_margin:
+    required: false
+    default: 300
+    description:
+      - Number of seconds subtracted from the start of the run to compute
+        the mark saved in I(sync_state), to absorb clock skew and
+        replication delays.
+  result_format:
+    required: false
+    choices: [full, summary, counts]
+    default: full
+    description:
+      - With C(full), I(results) holds the entries with their values.
+      - With C(summary), I(results) holds, for each DN, the hashes of the
+        values of each attribute.
+      - With C(counts), only I(count) is returned.
+  result_max_bytes:
+    required: false
+    default: 1048576
+    description:
+      - Maximum size in bytes of the JSON of I(results). When it is larger,
+        the whole result is written to I(result_spill_path) on the managed
+        host and only the first entries are returned. Set to C(0) to disable
+        the limit. It does not apply with I(first_only), whose single entry is
+        always returned.
+  result_spill_path:
+    required: false
+    default: null
+    description:
+      - File on the managed host where a result larger than
+        I(result_max_bytes) is written. A temporary file is used by default.
+  trace_file:
+    required: false
+    default: null
+    description:
+      - File on the managed host where a JSON line is appended for each
+        LDAP operation, with its type, target and duration.
 """
 
 
@@ -102,6 +185,18 @@ EXAMPLES = """
     scope_base: "o=gluu"
     search_filter: "(objectClass=gluuPerson)"
 
+- name: Get the users changed since the last drift check
+  ldap_get:
+    base_scope: "o=gluu"
+    search_filter: "(objectClass=gluuPerson)"
+    sync_state: /var/lib/gluu-configuration/drift-check.json
+
+- name: Snapshot the users in a compressed LDIF file
+  ldap_get:
+    base_scope: "o=gluu"
+    search_filter: "(objectClass=gluuPerson)"
+    dest: /root/backup/people.ldif.gz
+
 #
 # The same as in the previous example but with the authentication details
 # stored in the ldap_auth variable:
@@ -124,21 +219,150 @@ entries:
   returned: success
   type: list
   sample: '[[2, "olcRootDN", ["cn=root,dc=example,dc=com"]]]'
+count:
+  description: Number of entries found.
+  returned: success
+  type: int
+checksum:
+  description: SHA-256 of the uncompressed content written to dest.
+  returned: when dest is set
+  type: str
+spill_file:
+  description: File on the managed host holding the whole result.
+  returned: when the result is larger than result_max_bytes
+  type: str
+stats:
+  description:
+    - Number, total, p50, p95 and max milliseconds of each type of LDAP
+      operation (connect, bind, search, compare, add, modify). The
+      connection to the server is opened by the first operation, usually the
+      bind, and counted in its time.
+  returned: when connected to the server
+  type: dict
+  sample: '{"search": {"count": 3, "total": 4.2, "p50": 1.1, "p95": 2.5, "max": 2.5}}'
 """
 
+import base64
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.gluu_ldap_result import (
+    RESULT_FORMATS, bound_result, summarize_entry)
+from ansible.module_utils.gluu_ldap_sync import (
+    SYNC_ATTRIBUTES, SyncState, detect_sync_attribute)
+from ansible.module_utils.gluu_ldap_stats import LdapStats
 
 try:
     import ldap
     import ldap.modlist
     import ldap.sasl
+    import ldif
+    from ldap.controls import SimplePagedResultsControl
 
     HAS_LDAP = True
 except ImportError:
     HAS_LDAP = False
 
 
+class EntryWriter(object):
+    """ Write entries to a JSONL or LDIF file, optionally compressed. """
+    def __init__(self, path, dest_format, compress):
+        self.path = path
+        self.dest_format = dest_format
+        self.count = 0
+        self.sha256 = hashlib.sha256()
+
+        # Write to a temporary file and move it at the end
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix='.%s.' % os.path.basename(path))
+        self.raw_file = os.fdopen(fd, 'wb')
+        self.file = self.raw_file
+        if compress:
+            self.file = gzip.GzipFile(
+                filename='', mode='wb', fileobj=self.raw_file, mtime=0)
+
+        self.ldif_writer = None
+        if dest_format == 'ldif':
+            self.ldif_writer = ldif.LDIFWriter(self)
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self.sha256.update(data)
+        self.file.write(data)
+
+    def write_entry(self, dn, attrs):
+        self.count += 1
+
+        if self.ldif_writer is not None:
+            self.ldif_writer.unparse(dn, attrs)
+            return
+
+        text_attrs = {}
+        binary_attrs = {}
+        for name, values in attrs.items():
+            for value in values:
+                try:
+                    if isinstance(value, bytes):
+                        value = value.decode('utf-8')
+                    text_attrs.setdefault(name, []).append(value)
+                except UnicodeDecodeError:
+                    binary_attrs.setdefault(name, []).append(
+                        base64.b64encode(value).decode('ascii'))
+
+        line = {'dn': dn, 'attributes': text_attrs}
+        if binary_attrs:
+            line['base64'] = binary_attrs
+
+        self.write(json.dumps(line, sort_keys=True) + '\n')
+
+    def close(self):
+        """ Close the file and return True if its content has changed. """
+        if self.file is not self.raw_file:
+            self.file.close()
+        self.raw_file.close()
+
+        changed = self.checksum() != self._previous_checksum()
+        if changed:
+            os.rename(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+        return changed
+
+    def abort(self):
+        try:
+            self.raw_file.close()
+            os.remove(self.tmp_path)
+        except (IOError, OSError):
+            pass
+
+    def checksum(self):
+        return self.sha256.hexdigest()
+
+    def _previous_checksum(self):
+        if not os.path.exists(self.path):
+            return None
+
+        sha256 = hashlib.sha256()
+        opener = gzip.open if self.path.endswith('.gz') else open
+        try:
+            with opener(self.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    sha256.update(chunk)
+        except (IOError, OSError):
+            return None
+
+        return sha256.hexdigest()
+
+
 class LdapEntries(object):
     def __init__(self, module):
         # Shortcuts
@@ -152,32 +376,81 @@ class LdapEntries(object):
         self.base_scope = self.module.params['base_scope']
         self.search_filter = self.module.params['search_filter']
 
+        # Time the operations sent to the server
+        self.stats = LdapStats(self.module.params['trace_file'])
+
         # Establish connection
         self.connection = self._connect_to_ldap()
 
+        self.sync = None
+        if self.module.params['sync_state']:
+            base = self.dn or self.base_scope
+            attribute = self.module.params['sync_attribute']
+            if attribute == 'auto':
+                attribute = detect_sync_attribute(self.connection, base)
+
+            self.sync = SyncState(
+                self.module.params['sync_state'],
+                '%s|%s|%s' % (self.server_uri, base, self.search_filter),
+                attribute, self.module.params['sync_margin'])
+
     def search_entries(self):
         """ Search with the serach_filter and return an array of entries """
-        result = None
+        base, search_filter = self._search_base_and_filter()
+
+        try:
+            result = self.connection.search_s(
+                base, ldap.SCOPE_SUBTREE, search_filter)
+        except ldap.NO_SUCH_OBJECT:
+            result = None
+
+        return result
+
+    def export_entries(self, writer, page_size):
+        """ Search page by page and write each entry with writer. """
+        base, search_filter = self._search_base_and_filter()
+
+        page_control = SimplePagedResultsControl(
+            True, size=page_size, cookie='')
+
+        while True:
+            msgid = self.connection.search_ext(
+                base, ldap.SCOPE_SUBTREE, search_filter,
+                serverctrls=[page_control])
+            _, rdata, _, resp_ctrls = self.connection.result3(msgid)
+
+            for (dn, attrs) in rdata:
+                # Skip search references
+                if dn is not None:
+                    writer.write_entry(dn, attrs)
+
+            cookie = None
+            for ctrl in resp_ctrls or []:
+                if ctrl.controlType == SimplePagedResultsControl.controlType:
+                    cookie = ctrl.cookie
+
+            if not cookie:
+                break
+
+            page_control.cookie = cookie
+
+    def _search_base_and_filter(self):
         if self.dn:
-            try:
-                result = self.connection.search_s(
-                    self.dn, ldap.SCOPE_SUBTREE)
-            except ldap.NO_SUCH_OBJECT:
-                result = None
+            base, search_filter = self.dn, '(objectClass=*)'
         else:
-            try:
-                result = self.connection.search_s(
-                    self.search_filter, ldap.SCOPE_SUBTREE)
-            except ldap.NO_SUCH_OBJECT:
-                result = None
+            base, search_filter = self.base_scope, self.search_filter
 
-        return result
+        # Only look at the entries changed since the last successful run
+        if self.sync is not None:
+            search_filter = self.sync.changed_filter(search_filter)
+
+        return base, search_filter
 
     def _connect_to_ldap(self):
         if not self.verify_cert:
             ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
 
-        connection = ldap.initialize(self.server_uri)
+        connection = self.stats.initialize(self.server_uri)
 
         if self.start_tls:
             try:
@@ -212,6 +485,17 @@ def main():
             'search_filter': dict(),
             'first_only': dict(default='unknow'),
             'params': dict(type='dict'),
+            'trace_file': dict(type='path'),
+            'dest': dict(type='path'),
+            'dest_format': dict(choices=['jsonl', 'ldif']),
+            'compress': dict(type='bool'),
+            'page_size': dict(default=500, type='int'),
+            'sync_state': dict(type='path'),
+            'sync_attribute': dict(default='auto', choices=SYNC_ATTRIBUTES),
+            'sync_margin': dict(default=300, type='int'),
+            'result_format': dict(default='full', choices=RESULT_FORMATS),
+            'result_max_bytes': dict(default=1048576, type='int'),
+            'result_spill_path': dict(type='path'),
         },
         required_one_of=[['dn', 'search_filter']],
         supports_check_mode=True,
@@ -241,10 +525,42 @@ def main():
     # Instantiate the LdapEntries object
     ldap_entries = LdapEntries(module)
 
+    # Stream all entries to a file on the managed host
+    if module.params['dest']:
+        dest = module.params['dest']
+        dest_format = module.params['dest_format']
+        if dest_format is None:
+            dest_format = 'ldif' if dest.endswith(('.ldif', '.ldif.gz')) else 'jsonl'
+        compress = module.params['compress']
+        if compress is None:
+            compress = dest.endswith('.gz')
+
+        if module.check_mode:
+            module.exit_json(changed=True, dest=dest)
+
+        writer = EntryWriter(dest, dest_format, compress)
+        try:
+            ldap_entries.export_entries(writer, module.params['page_size'])
+        except ldap.LDAPError:
+            e = get_exception()
+            writer.abort()
+            module.fail_json(msg="Cannot export the entries.", details=str(e))
+
+        changed = writer.close()
+        if ldap_entries.sync is not None:
+            ldap_entries.sync.save()
+
+        module.exit_json(
+            changed=changed, dest=dest, count=writer.count,
+            checksum=writer.checksum(), stats=ldap_entries.stats.summary())
+
     # Search for all entries
     entries = ldap_entries.search_entries()
 
-    if not entries:
+    if not entries and ldap_entries.sync is not None:
+        # Nothing has changed since the last run
+        entries = []
+    elif not entries:
         if module.params['dn']:
             module.fail_json(
                 msg="No entry found for this dn %s" % module.params['dn'],
@@ -254,10 +570,34 @@ def main():
                 msg="No entry found for this search_filter %s" % module.params['search_filter'],
                 base_scope=module.params['base_scope'], search_filter=module.params['search_filter'])
 
-    if module.params['first_only'] == 'yes':
+    if ldap_entries.sync is not None and not module.check_mode:
+        ldap_entries.sync.save()
+
+    result = dict(count=len(entries))
+
+    if module.params['result_format'] == 'summary':
+        entries = [(dn, summarize_entry(attrs)) for (dn, attrs) in entries]
+        if module.params['first_only'] == 'yes' and entries:
+            entries = entries[0]
+        else:
+            entries = dict(entries)
+    elif module.params['first_only'] == 'yes' and entries:
         entries = entries[0]
 
-    module.exit_json(results=entries)
+    if module.params['result_format'] != 'counts':
+        # The single entry of first_only is indexed by the tasks, so it is
+        # never truncated
+        max_bytes = module.params['result_max_bytes']
+        if module.params['first_only'] == 'yes':
+            max_bytes = 0
+
+        result['results'], extra = bound_result(
+            entries, max_bytes, module.params['result_spill_path'])
+        result.update(extra)
+
+    result['stats'] = ldap_entries.stats.summary()
+
+    module.exit_json(**result)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+
+DOCUMENTATION = """
+---
+module: ldap_journal
+short_description: Read or consume the journal of the LDAP changes.
+description:
+  - Read the journal written by the gluu-ldap-watcher daemon, which records
+    the DNs changed on the LDAP server with a persistent search or a syncrepl
+    session, or remove the records already reconciled from it.
+  - The I(dns) read can be given to the I(changed_dns) option of
+    C(ldap_upsert) to only reconcile the entries listed in the journal,
+    which is then read once for the whole run.
+author:
+  - Guillaume Smaha
+options:
+  path:
+    required: true
+    description:
+      - Path of the journal on the managed host.
+  state:
+    required: false
+    choices: [read, consume]
+    default: read
+    description:
+      - With C(read), return the DNs of the journal and the offset of the
+        last record read.
+      - With C(consume), remove the records up to I(offset). The records
+        appended since the journal has been read are kept.
+  offset:
+    required: false
+    description:
+      - Offset returned by a previous C(read) of the journal. Required with
+        C(state=consume).
+"""
+
+
+EXAMPLES = """
+- name: Read the changes recorded since the last run
+  ldap_journal:
+    path: /var/lib/gluu-configuration/ldap-journal.jsonl
+  register: ldap_journal
+
+- name: Remove the reconciled changes
+  ldap_journal:
+    path: /var/lib/gluu-configuration/ldap-journal.jsonl
+    state: consume
+    offset: "{{ ldap_journal.offset }}"
+"""
+
+
+RETURN = """
+dns:
+  description: DNs changed according to the journal, sorted.
+  returned: state is read
+  type: list
+count:
+  description: Number of records read.
+  returned: state is read
+  type: int
+offset:
+  description: Offset after the last record read.
+  returned: state is read
+  type: int
+resync:
+  description:
+    - True when the journal is missing or changes may have been lost, in
+      which case every entry must be reconciled.
+  returned: state is read
+  type: bool
+"""
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.gluu_ldap_journal import Journal
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'path': dict(required=True, type='path'),
+            'state': dict(default='read', choices=['read', 'consume']),
+            'offset': dict(type='int'),
+        },
+        supports_check_mode=True,
+    )
+
+    journal = Journal(module.params['path'])
+
+    if module.params['state'] == 'consume':
+        if module.params['offset'] is None:
+            module.fail_json(msg="offset is required with state=consume.")
+
+        changed = journal.exists() and module.params['offset'] > 0
+        if changed and not module.check_mode:
+            try:
+                journal.consume(module.params['offset'])
+            except (IOError, OSError):
+                e = get_exception()
+                module.fail_json(
+                    msg="Cannot consume the journal.", details=str(e))
+
+        module.exit_json(changed=changed)
+
+    try:
+        records, offset = journal.read()
+    except (IOError, OSError):
+        e = get_exception()
+        module.fail_json(msg="Cannot read the journal.", details=str(e))
+
+    dns = {}
+    resync = not journal.exists()
+    for record in records:
+        if record.get('change') == 'resync':
+            resync = True
+        for key in ['dn', 'previous_dn']:
+            if record.get(key):
+                dns[record[key].lower()] = record[key]
+
+    module.exit_json(
+        changed=False, dns=sorted(dns.values(), key=lambda dn: dn.lower()),
+        count=len(records), offset=offset, resync=resync)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+
+DOCUMENTATION = """
+---
+module: ldap_membership
+short_description: Maintain the group memberships on both sides.
+description:
+  - Maintain the C(member) attribute of the groups and the C(memberOf)
+    attribute of their members together, from a single relation.
+  - The current values of both sides are read with one search per side and
+    batch of entries, and only the missing or extra values are added or
+    deleted, in a single batch of pipelined writes.
+notes:
+  - The members which do not exist yet are kept in the C(member) attribute
+    of the group; their C(memberOf) attribute is updated by the next run.
+author:
+  - Guillaume Smaha
+requirements:
+  - python-ldap
+options:
+  bind_dn:
+    required: false
+    default: null
+    description:
+      - A DN to bind with. If this is omitted, we'll try a SASL bind with
+        the EXTERNAL mechanism. If this is blank, we'll use an anonymous
+        bind.
+  bind_pw:
+    required: false
+    default: null
+    description:
+      - The password to use with I(bind_dn).
+  base_scope:
+    required: false
+    description:
+      - Base of the searches of the groups and of their members. Without it,
+        each entry is read with its own search.
+  memberships:
+    required: true
+    description:
+      - The dn of each managed group with the list of the dns of its members.
+  state:
+    required: false
+    choices: [present, exact]
+    default: exact
+    description:
+      - With C(present), only the missing memberships are added.
+      - With C(exact), the members of the managed groups which are not in
+        I(memberships) are removed, on both sides.
+  group_attribute:
+    required: false
+    default: member
+    description:
+      - Attribute of the groups listing their members.
+  member_attribute:
+    required: false
+    default: memberOf
+    description:
+      - Attribute of the members listing their groups.
+  batch_size:
+    required: false
+    default: 100
+    description:
+      - Maximum number of entries read with a single search.
+  params:
+    required: false
+    default: null
+    description:
+      - List of options which allows to overwrite any of the task options.
+  plan_file:
+    required: false
+    default: null
+    description:
+      - Append the modifications to this plan on the managed host instead of
+        performing them, to send them later with C(ldap_apply).
+  server_uri:
+    required: false
+    default: ldapi:///
+    description:
+      - A URI to the LDAP server. The default value lets the underlying
+        LDAP client library look for a UNIX domain socket in its default
+        location.
+  start_tls:
+    required: false
+    choices: ['yes', 'no']
+    default: 'no'
+    description:
+      - If true, we'll use the START_TLS LDAP extension.
+  validate_certs:
+    required: false
+    choices: ['yes', 'no']
+    default: 'yes'
+    description:
+      - If C(no), SSL certificates will not be validated. This should only be
+        used on sites using self-signed certificates.
+"""
+
+
+EXAMPLES = """
+- name: Maintain the members of the admin group
+  ldap_membership:
+    params: "{{ ldap_auth }}"
+    base_scope: o=gluu
+    memberships:
+      "inum=@!1111!0003!0010,ou=groups,o=@!1111,o=gluu":
+        - "inum=@!1111!0000!0010,ou=people,o=@!1111,o=gluu"
+        - "inum=@!1111!0000!0020,ou=people,o=@!1111,o=gluu"
+
+- name: Maintain the memberships of the role
+  ldap_membership:
+    params: "{{ ldap_params }}"
+    memberships: "{{ gluu_groups | gluu_memberships(gluu_users, base_inum=gluu_inum_org) }}"
+"""
+
+
+RETURN = """
+modlists:
+  description: Modifications by dn.
+  returned: success
+  type: dict
+counts:
+  description: Number of memberships added and removed.
+  returned: success
+  type: dict
+  sample: '{"add": 2, "delete": 0}'
+missing:
+  description: Members which do not exist on the server.
+  returned: success
+  type: list
+"""
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.six import PY2
+from ansible.module_utils.gluu_ldap_plan import Plan
+from ansible.module_utils.gluu_ldap_schema import to_bytes, to_text
+
+try:
+    import ldap
+    import ldap.dn
+    import ldap.filter
+    import ldap.sasl
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+def dn_key(dn):
+    """ Return a key to compare two dns. """
+    try:
+        return ldap.dn.dn2str(ldap.dn.str2dn(dn)).lower()
+    except ldap.DECODING_ERROR:
+        return dn.lower()
+
+
+class LdapMemberships(object):
+    def __init__(self, module):
+        # Shortcuts
+        self.module = module
+        self.server_uri = self.module.params['server_uri']
+        self.bind_dn = self.module.params['bind_dn']
+        self.bind_pw = self.module.params['bind_pw']
+        self.start_tls = self.module.params['start_tls']
+        self.verify_cert = self.module.params['validate_certs']
+        self.base_scope = self.module.params['base_scope']
+        self.batch_size = max(1, self.module.params['batch_size'])
+        self.group_attribute = self.module.params['group_attribute']
+        self.member_attribute = self.module.params['member_attribute']
+        self.exact = self.module.params['state'] == 'exact'
+
+        # Desired relation, indexed by the key of the dns
+        self.dns = {}
+        self.desired = {}
+        for (group, members) in self.module.params['memberships'].items():
+            group_key = self._index(group)
+            self.desired[group_key] = set(
+                self._index(member) for member in members or [])
+
+        # Establish connection
+        self.connection = self._connect_to_ldap()
+
+    def modlists(self):
+        """ Return the modifications of both sides, by dn, and the members
+            which do not exist. """
+        groups = self._read(list(self.desired.keys()), self.group_attribute)
+        current = dict(
+            (group_key, set(self._index(v) for v in values))
+            for (group_key, values) in groups.items())
+
+        # Every member on one side or the other of a managed group
+        member_keys = set()
+        for group_key in self.desired:
+            member_keys.update(self.desired[group_key])
+            member_keys.update(current.get(group_key, set()))
+        if self.exact:
+            member_keys.update(self._members_of(list(self.desired.keys())))
+
+        members = self._read(sorted(member_keys), self.member_attribute)
+        member_of = dict(
+            (member_key, set(self._index(v) for v in values))
+            for (member_key, values) in members.items())
+
+        changes = {}
+
+        for (group_key, desired) in self.desired.items():
+            if group_key not in current:
+                self.module.fail_json(
+                    msg="Group %s does not exist." % self.dns[group_key])
+
+            to_add = desired - current[group_key]
+            to_delete = current[group_key] - desired if self.exact else set()
+            self._change(changes, group_key, self.group_attribute, to_add, to_delete)
+
+        for member_key in sorted(member_keys):
+            if member_key not in member_of:
+                continue
+
+            groups_of = member_of[member_key]
+            to_add = set(
+                group_key for (group_key, desired) in self.desired.items()
+                if member_key in desired and group_key not in groups_of)
+            to_delete = set()
+            if self.exact:
+                to_delete = set(
+                    group_key for (group_key, desired) in self.desired.items()
+                    if member_key not in desired and group_key in groups_of)
+            self._change(
+                changes, member_key, self.member_attribute, to_add, to_delete)
+
+        missing = sorted(
+            self.dns[member_key] for member_key in member_keys
+            if member_key not in member_of)
+
+        return changes, missing
+
+    def apply(self, changes):
+        """ Send all the modifications, then wait for their results. """
+        pending = {}
+        try:
+            for (dn, modlist) in changes.items():
+                msgid = self.connection.modify_ext(
+                    to_bytes(dn) if PY2 else dn, modlist)
+                pending[msgid] = dn
+
+            while pending:
+                try:
+                    msgid = self.connection.result3(ldap.RES_ANY, all=1)[2]
+                except ldap.LDAPError:
+                    e = get_exception()
+                    info = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+                    self.module.fail_json(
+                        msg="Membership action failed.", details=str(e),
+                        dn=pending.get(info.get('msgid')))
+                pending.pop(msgid, None)
+        except Exception:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Membership action failed.", details=str(e))
+
+    def _change(self, changes, key, attribute, to_add, to_delete):
+        modlist = []
+        # python-ldap only accepts byte strings as values
+        if to_add:
+            modlist.append((ldap.MOD_ADD, attribute, sorted(
+                to_bytes(self.dns[k]) for k in to_add)))
+        if to_delete:
+            modlist.append((ldap.MOD_DELETE, attribute, sorted(
+                to_bytes(self.dns[k]) for k in to_delete)))
+
+        if modlist:
+            changes[self.dns[key]] = modlist
+
+    def _index(self, dn):
+        key = dn_key(to_text(dn))
+        self.dns.setdefault(key, to_text(dn))
+
+        return key
+
+    def _read(self, keys, attribute):
+        """ Return the values of attribute of the existing entries, by key. """
+        found = {}
+
+        if self.base_scope:
+            searches = []
+            for start in range(0, len(keys), self.batch_size):
+                searches.append((
+                    self.base_scope, ldap.SCOPE_SUBTREE, '(|%s)' % ''.join(
+                        '(entryDN=%s)' % ldap.filter.escape_filter_chars(
+                            self.dns[key])
+                        for key in keys[start:start + self.batch_size])))
+        else:
+            searches = [
+                (self.dns[key], ldap.SCOPE_BASE, '(objectClass=*)')
+                for key in keys]
+
+        for (base, scope, search_filter) in searches:
+            try:
+                results = self.connection.search_s(
+                    base, scope, search_filter, attrlist=[attribute])
+            except ldap.NO_SUCH_OBJECT:
+                continue
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(
+                    msg="Cannot search for %s" % attribute, details=str(e))
+
+            for (dn, attrs) in results:
+                if dn is None:
+                    continue
+                values = []
+                for (name, attr_values) in attrs.items():
+                    if name.lower() == attribute.lower():
+                        values = [to_text(v) for v in attr_values]
+                found[self._index(dn)] = values
+
+        return found
+
+    def _members_of(self, group_keys):
+        """ Return the keys of the entries naming a group in their
+            member_attribute, to remove the stale side of a membership. """
+        if not self.base_scope:
+            return set()
+
+        member_keys = set()
+        for start in range(0, len(group_keys), self.batch_size):
+            search_filter = '(|%s)' % ''.join(
+                '(%s=%s)' % (
+                    self.member_attribute,
+                    ldap.filter.escape_filter_chars(self.dns[key]))
+                for key in group_keys[start:start + self.batch_size])
+            try:
+                results = self.connection.search_s(
+                    self.base_scope, ldap.SCOPE_SUBTREE, search_filter,
+                    attrlist=['1.1'])
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(
+                    msg="Cannot search for the members.", details=str(e))
+
+            for (dn, attrs) in results:
+                if dn is not None:
+                    member_keys.add(self._index(dn))
+
+        return member_keys
+
+    def _connect_to_ldap(self):
+        if not self.verify_cert:
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+
+        connection = ldap.initialize(self.server_uri)
+
+        if self.start_tls:
+            try:
+                connection.start_tls_s()
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(msg="Cannot start TLS.", details=str(e))
+
+        try:
+            if self.bind_dn is not None:
+                connection.simple_bind_s(self.bind_dn, self.bind_pw)
+            else:
+                connection.sasl_interactive_bind_s('', ldap.sasl.external())
+        except ldap.LDAPError:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Cannot bind to the server.", details=str(e))
+
+        return connection
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'bind_dn': dict(default=None),
+            'bind_pw': dict(default='', no_log=True),
+            'base_scope': dict(),
+            'memberships': dict(required=True, type='dict'),
+            'state': dict(default='exact', choices=['present', 'exact']),
+            'group_attribute': dict(default='member'),
+            'member_attribute': dict(default='memberOf'),
+            'batch_size': dict(default=100, type='int'),
+            'params': dict(type='dict'),
+            'plan_file': dict(type='path'),
+            'server_uri': dict(default='ldapi:///'),
+            'start_tls': dict(default=False, type='bool'),
+            'validate_certs': dict(default=True, type='bool'),
+        },
+        supports_check_mode=True,
+    )
+
+    if not HAS_LDAP:
+        module.fail_json(
+            msg="Missing required 'ldap' module (pip install python-ldap)")
+
+    # Update module parameters with user's parameters if defined
+    if 'params' in module.params and isinstance(module.params['params'], dict):
+        module.params.update(module.params['params'])
+        # Remove the params
+        module.params.pop('params', None)
+
+    memberships = LdapMemberships(module)
+    changes, missing = memberships.modlists()
+
+    counts = {'add': 0, 'delete': 0}
+    for modlist in changes.values():
+        for (mod_op, name, values) in modlist:
+            if name == module.params['group_attribute']:
+                counts['add' if mod_op == ldap.MOD_ADD else 'delete'] += len(values)
+
+    if changes and not module.check_mode:
+        if module.params['plan_file']:
+            # Record the modifications in the plan instead of performing them
+            plan = Plan(module.params['plan_file'])
+            for dn in sorted(changes):
+                plan.append(dn, 'modify', changes[dn])
+        else:
+            memberships.apply(changes)
+
+    modlists = dict(
+        (dn, [(mod_op, name, [to_text(v) for v in values])
+              for (mod_op, name, values) in modlist])
+        for (dn, modlist) in changes.items())
+
+    module.exit_json(
+        changed=bool(changes), modlists=modlists, counts=counts,
+        missing=missing)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+
+DOCUMENTATION = """
+---
+module: ldap_replication
+short_description: Read the replication state of a LDAP server or wait for it.
+description:
+  - Read the latest change sequence number (CSN) of each replica known by
+    the server on I(base_scope), from C(ds-sync-state) (OpenDJ) or
+    C(contextCSN) (OpenLDAP).
+  - Or wait until the server has received all the changes of a previous
+    state, typically the state of the node which has been written.
+author:
+  - Guillaume Smaha
+requirements:
+  - python-ldap
+options:
+  bind_dn:
+    required: false
+    default: null
+    description:
+      - A DN to bind with. If this is omitted, we'll try a SASL bind with
+        the EXTERNAL mechanism. If this is blank, we'll use an anonymous
+        bind.
+  bind_pw:
+    required: false
+    default: null
+    description:
+      - The password to use with I(bind_dn).
+  base_scope:
+    required: false
+    default: o=gluu
+    description:
+      - Replicated suffix.
+  state:
+    required: false
+    choices: [read, wait]
+    default: read
+    description:
+      - With C(read), return the CSN of each replica.
+      - With C(wait), wait until the CSN of each replica of I(csns) has been
+        reached.
+  csns:
+    required: false
+    description:
+      - CSN of each replica to wait for, as returned by C(state=read).
+        Required with C(state=wait).
+  timeout:
+    required: false
+    default: 300
+    description:
+      - Maximum number of seconds to wait.
+  interval:
+    required: false
+    default: 1
+    description:
+      - Seconds between two reads of the state.
+  params:
+    required: false
+    default: null
+    description:
+      - List of options which allows to overwrite any of the task options.
+  server_uri:
+    required: false
+    default: ldapi:///
+    description:
+      - A URI to the LDAP server. The default value lets the underlying
+        LDAP client library look for a UNIX domain socket in its default
+        location.
+  start_tls:
+    required: false
+    choices: ['yes', 'no']
+    default: 'no'
+    description:
+      - If true, we'll use the START_TLS LDAP extension.
+  validate_certs:
+    required: false
+    choices: ['yes', 'no']
+    default: 'yes'
+    description:
+      - If C(no), SSL certificates will not be validated. This should only be
+        used on sites using self-signed certificates.
+"""
+
+
+EXAMPLES = """
+- name: Read the replication state of the writer
+  ldap_replication:
+    params: "{{ ldap_params }}"
+  register: writer_state
+  when: inventory_hostname == writer
+
+- name: Wait for the changes of the writer
+  ldap_replication:
+    params: "{{ ldap_params }}"
+    state: wait
+    csns: "{{ hostvars[writer]['writer_state'].csns }}"
+  when: inventory_hostname != writer
+"""
+
+
+RETURN = """
+csns:
+  description: Latest CSN of each replica, by replica id.
+  returned: success
+  type: dict
+  sample: '{"001": "20181019120000.123456Z#000000#001#000000"}'
+lagging:
+  description: Replicas whose CSN was not reached, with both CSNs.
+  returned: on timeout
+  type: dict
+wait_time:
+  description: Seconds waited.
+  returned: state is wait
+  type: float
+"""
+
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pycompat24 import get_exception
+from ansible.module_utils.gluu_ldap_schema import to_text
+
+try:
+    import ldap
+    import ldap.sasl
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+def parse_csn(csn):
+    """ Return the replica id of a CSN and a key to compare the CSNs of the
+        same replica. """
+    csn = to_text(csn).strip()
+
+    # OpenLDAP: 20181019120000.123456Z#000000#001#000000
+    if '#' in csn:
+        parts = csn.split('#')
+        return parts[2], (parts[0], parts[1], parts[3])
+
+    # OpenDJ: <16 hex digits of time><4 of server id><8 of sequence number>,
+    # optionally prefixed by the replicated base dn
+    csn = csn.split(' ')[-1].split(':')[-1]
+    return csn[16:20], (csn[:16].lower(), csn[20:].lower())
+
+
+class LdapReplication(object):
+    def __init__(self, module):
+        # Shortcuts
+        self.module = module
+        self.server_uri = self.module.params['server_uri']
+        self.bind_dn = self.module.params['bind_dn']
+        self.bind_pw = self.module.params['bind_pw']
+        self.start_tls = self.module.params['start_tls']
+        self.verify_cert = self.module.params['validate_certs']
+        self.base_scope = self.module.params['base_scope']
+
+        # Establish connection
+        self.connection = self._connect_to_ldap()
+
+    def csns(self):
+        """ Return the latest CSN of each replica. """
+        try:
+            results = self.connection.search_s(
+                self.base_scope, ldap.SCOPE_BASE, '(objectClass=*)',
+                attrlist=['ds-sync-state', 'contextCSN'])
+        except ldap.LDAPError:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Cannot read the replication state.", details=str(e))
+
+        csns = {}
+        for (name, values) in results[0][1].items():
+            for value in values:
+                (replica, key) = parse_csn(value)
+                if replica not in csns or key > parse_csn(csns[replica])[1]:
+                    csns[replica] = to_text(value)
+
+        return csns
+
+    def lagging(self, target):
+        """ Return the replicas of target whose CSN is not reached yet. """
+        current = self.csns()
+        lagging = {}
+
+        for (replica, csn) in target.items():
+            if (replica not in current or
+                    parse_csn(current[replica])[1] < parse_csn(csn)[1]):
+                lagging[replica] = {'expected': csn, 'current': current.get(replica)}
+
+        return lagging
+
+    def _connect_to_ldap(self):
+        if not self.verify_cert:
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+
+        connection = ldap.initialize(self.server_uri)
+
+        if self.start_tls:
+            try:
+                connection.start_tls_s()
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(msg="Cannot start TLS.", details=str(e))
+
+        try:
+            if self.bind_dn is not None:
+                connection.simple_bind_s(self.bind_dn, self.bind_pw)
+            else:
+                connection.sasl_interactive_bind_s('', ldap.sasl.external())
+        except ldap.LDAPError:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Cannot bind to the server.", details=str(e))
+
+        return connection
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'bind_dn': dict(default=None),
+            'bind_pw': dict(default='', no_log=True),
+            'base_scope': dict(default='o=gluu'),
+            'state': dict(default='read', choices=['read', 'wait']),
+            'csns': dict(type='dict'),
+            'timeout': dict(default=300, type='int'),
+            'interval': dict(default=1, type='int'),
+            'params': dict(type='dict'),
+            'server_uri': dict(default='ldapi:///'),
+            'start_tls': dict(default=False, type='bool'),
+            'validate_certs': dict(default=True, type='bool'),
+        },
+        supports_check_mode=True,
+    )
+
+    if not HAS_LDAP:
+        module.fail_json(
+            msg="Missing required 'ldap' module (pip install python-ldap)")
+
+    # Update module parameters with user's parameters if defined
+    if 'params' in module.params and isinstance(module.params['params'], dict):
+        module.params.update(module.params['params'])
+        # Remove the params
+        module.params.pop('params', None)
+
+    replication = LdapReplication(module)
+
+    if module.params['state'] == 'read':
+        module.exit_json(changed=False, csns=replication.csns())
+
+    if module.params['csns'] is None:
+        module.fail_json(msg="csns is required with state=wait.")
+
+    start = time.time()
+    lagging = replication.lagging(module.params['csns'])
+    while lagging:
+        if time.time() - start > module.params['timeout']:
+            module.fail_json(
+                msg="Replication did not converge after %d seconds." % module.params['timeout'],
+                lagging=lagging)
+
+        time.sleep(module.params['interval'])
+        lagging = replication.lagging(module.params['csns'])
+
+    module.exit_json(
+        changed=False, csns=replication.csns(),
+        wait_time=round(time.time() - start, 3))
+
+
+if __name__ == '__main__':
+    main()
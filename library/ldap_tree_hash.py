@@ -0,0 +1,362 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+ANSIBLE_METADATA = {'metadata_version': '1.0',
+                    'status': ['preview'],
+                    'supported_by': 'Guillaume Smaha'}
+
+
+DOCUMENTATION = """
+---
+module: ldap_tree_hash
+short_description: Hash LDAP subtrees in a Merkle tree to compare servers.
+description:
+  - Read every entry of I(subtrees) from the server of the node and build a
+    hash tree: the entries of a subtree are spread in buckets by the hash of
+    their dn, on I(bucket_levels) levels of 256 buckets, and each bucket is
+    hashed from the hashes of its children.
+  - The tree is kept in I(state_file) on the managed host and only the
+    hashes of the children of the I(expand) paths are returned, so two
+    servers are compared by drilling down only into the branches whose
+    hashes differ, with the C(gluu_tree_diff) filter.
+  - The paths are C('') for the subtrees, C(subtree|xx) and
+    C(subtree|xx|yy) for the buckets, and the children of the last level of
+    buckets are the dns of the entries.
+author:
+  - Guillaume Smaha
+requirements:
+  - python-ldap
+options:
+  bind_dn:
+    required: false
+    default: null
+    description:
+      - A DN to bind with. If this is omitted, we'll try a SASL bind with
+        the EXTERNAL mechanism. If this is blank, we'll use an anonymous
+        bind.
+  bind_pw:
+    required: false
+    default: null
+    description:
+      - The password to use with I(bind_dn).
+  subtrees:
+    required: true
+    description:
+      - List of the base dns of the subtrees to hash.
+  expand:
+    required: false
+    default: ['']
+    description:
+      - Paths of the tree whose children hashes are returned.
+  refresh:
+    required: false
+    default: true
+    description:
+      - Read the entries and build the tree again. With C(no), the tree of
+        I(state_file) is used.
+  bucket_levels:
+    required: false
+    default: 2
+    description:
+      - Number of levels of buckets under each subtree.
+  ignore_attributes:
+    required: false
+    default: []
+    description:
+      - Attributes left out of the hash of the entries, like attributes
+        updated locally on each node.
+  state_file:
+    required: false
+    default: ~/.ansible/cache/ldap_tree_hash.json
+    description:
+      - File on the managed host holding the tree between two calls.
+  page_size:
+    required: false
+    default: 500
+    description:
+      - Number of entries read with each page of the search.
+  params:
+    required: false
+    default: null
+    description:
+      - List of options which allows to overwrite any of the task options.
+  server_uri:
+    required: false
+    default: ldapi:///
+    description:
+      - A URI to the LDAP server. The default value lets the underlying
+        LDAP client library look for a UNIX domain socket in its default
+        location.
+  start_tls:
+    required: false
+    choices: ['yes', 'no']
+    default: 'no'
+    description:
+      - If true, we'll use the START_TLS LDAP extension.
+  validate_certs:
+    required: false
+    choices: ['yes', 'no']
+    default: 'yes'
+    description:
+      - If C(no), SSL certificates will not be validated. This should only be
+        used on sites using self-signed certificates.
+"""
+
+
+EXAMPLES = """
+- name: Hash the people and the groups
+  ldap_tree_hash:
+    params: "{{ ldap_params }}"
+    subtrees:
+      - ou=people,o=@!1111,o=gluu
+      - ou=groups,o=@!1111,o=gluu
+  register: tree
+
+- name: Drill down into the subtrees which differ between the nodes
+  ldap_tree_hash:
+    params: "{{ ldap_params }}"
+    subtrees:
+      - ou=people,o=@!1111,o=gluu
+      - ou=groups,o=@!1111,o=gluu
+    expand: "{{ groups['gluu-servers'] | map('extract', hostvars, ['tree', 'children']) | list | gluu_tree_diff }}"
+    refresh: no
+"""
+
+
+RETURN = """
+children:
+  description: Hashes of the children of each expanded path.
+  returned: success
+  type: dict
+  sample: '{"": {"ou=people,o=@!1111,o=gluu": "5f0c..."}}'
+count:
+  description: Number of entries hashed.
+  returned: when refresh is set
+  type: int
+"""
+
+import hashlib
+import json
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pycompat24 import get_exception
+
+try:
+    import ldap
+    import ldap.sasl
+    from ldap.controls import SimplePagedResultsControl
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+def sha1(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+
+    return hashlib.sha1(data).hexdigest()
+
+
+class LdapTreeHash(object):
+    def __init__(self, module):
+        # Shortcuts
+        self.module = module
+        self.server_uri = self.module.params['server_uri']
+        self.bind_dn = self.module.params['bind_dn']
+        self.bind_pw = self.module.params['bind_pw']
+        self.start_tls = self.module.params['start_tls']
+        self.verify_cert = self.module.params['validate_certs']
+        self.bucket_levels = self.module.params['bucket_levels']
+        self.page_size = self.module.params['page_size']
+        self.ignore_attributes = set(
+            name.lower() for name in self.module.params['ignore_attributes'])
+
+        # Children hashes of each path of the tree
+        self.nodes = {}
+        self.existing = set()
+        self.count = 0
+
+    def build(self, subtrees):
+        """ Read the entries of the subtrees and hash them in a tree. """
+        self.connection = self._connect_to_ldap()
+        self.nodes = {'': {}}
+
+        for subtree in subtrees:
+            buckets = {}
+            for (dn, attrs) in self._entries(subtree):
+                self.count += 1
+                key = sha1(dn.lower())
+                path = subtree
+                for level in range(self.bucket_levels):
+                    path = '%s|%s' % (path, key[level * 2:level * 2 + 2])
+                buckets.setdefault(path, {})[dn] = self._entry_hash(attrs)
+
+            if subtree not in self.existing:
+                continue
+
+            # Hash the buckets from the deepest level up to the subtree
+            self.nodes.update(buckets)
+            for level in range(self.bucket_levels, 0, -1):
+                parents = {}
+                for (path, children) in buckets.items():
+                    parent = path.rsplit('|', 1)[0]
+                    parents.setdefault(parent, {})[path] = self._node_hash(children)
+                self.nodes.update(parents)
+                buckets = parents
+
+            self.nodes[''][subtree] = self._node_hash(
+                self.nodes.get(subtree, {}))
+
+    def children(self, paths):
+        return dict((path, self.nodes.get(path, {})) for path in paths)
+
+    def load(self, path):
+        with open(path) as f:
+            self.nodes = json.load(f)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.nodes, f, sort_keys=True)
+        os.rename(tmp_path, path)
+
+    def _entry_hash(self, attrs):
+        """ Hash the attributes of an entry, whatever the order of the
+            attributes and of their values. """
+        content = []
+        for (name, values) in attrs.items():
+            if name.lower() in self.ignore_attributes:
+                continue
+            content.append((name.lower(), sorted(
+                sha1(v) for v in values)))
+
+        return sha1(json.dumps(sorted(content)))
+
+    def _node_hash(self, children):
+        return sha1(json.dumps(sorted(children.items())))
+
+    def _entries(self, subtree):
+        """ Search the entries of subtree page by page. """
+        page_control = SimplePagedResultsControl(
+            True, size=self.page_size, cookie='')
+
+        while True:
+            try:
+                msgid = self.connection.search_ext(
+                    subtree, ldap.SCOPE_SUBTREE, '(objectClass=*)',
+                    serverctrls=[page_control])
+                _, rdata, _, resp_ctrls = self.connection.result3(msgid)
+            except ldap.NO_SUCH_OBJECT:
+                return
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(
+                    msg="Cannot search for the entries of %s" % subtree,
+                    details=str(e))
+
+            self.existing.add(subtree)
+            for (dn, attrs) in rdata:
+                # Skip search references
+                if dn is not None:
+                    yield dn, attrs
+
+            cookie = None
+            for ctrl in resp_ctrls or []:
+                if ctrl.controlType == SimplePagedResultsControl.controlType:
+                    cookie = ctrl.cookie
+
+            if not cookie:
+                break
+
+            page_control.cookie = cookie
+
+    def _connect_to_ldap(self):
+        if not self.verify_cert:
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+
+        connection = ldap.initialize(self.server_uri)
+
+        if self.start_tls:
+            try:
+                connection.start_tls_s()
+            except ldap.LDAPError:
+                e = get_exception()
+                self.module.fail_json(msg="Cannot start TLS.", details=str(e))
+
+        try:
+            if self.bind_dn is not None:
+                connection.simple_bind_s(self.bind_dn, self.bind_pw)
+            else:
+                connection.sasl_interactive_bind_s('', ldap.sasl.external())
+        except ldap.LDAPError:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Cannot bind to the server.", details=str(e))
+
+        return connection
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'bind_dn': dict(default=None),
+            'bind_pw': dict(default='', no_log=True),
+            'subtrees': dict(required=True, type='list'),
+            'expand': dict(default=[''], type='list'),
+            'refresh': dict(default=True, type='bool'),
+            'bucket_levels': dict(default=2, type='int'),
+            'ignore_attributes': dict(default=[], type='list'),
+            'state_file': dict(
+                default='~/.ansible/cache/ldap_tree_hash.json', type='path'),
+            'page_size': dict(default=500, type='int'),
+            'params': dict(type='dict'),
+            'server_uri': dict(default='ldapi:///'),
+            'start_tls': dict(default=False, type='bool'),
+            'validate_certs': dict(default=True, type='bool'),
+        },
+        supports_check_mode=True,
+    )
+
+    if not HAS_LDAP:
+        module.fail_json(
+            msg="Missing required 'ldap' module (pip install python-ldap)")
+
+    # Update module parameters with user's parameters if defined
+    if 'params' in module.params and isinstance(module.params['params'], dict):
+        module.params.update(module.params['params'])
+        # Remove the params
+        module.params.pop('params', None)
+
+    tree = LdapTreeHash(module)
+    result = dict(changed=False)
+
+    if module.params['refresh']:
+        tree.build(module.params['subtrees'])
+        try:
+            tree.save(module.params['state_file'])
+        except (IOError, OSError):
+            e = get_exception()
+            module.fail_json(msg="Cannot save the tree.", details=str(e))
+        result['count'] = tree.count
+    else:
+        try:
+            tree.load(module.params['state_file'])
+        except (IOError, OSError, ValueError):
+            e = get_exception()
+            module.fail_json(msg="Cannot load the tree.", details=str(e))
+
+    result['children'] = tree.children(module.params['expand'])
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,10 @@ short_description: Add or update LDAP entries.
 description:
   - Add or update attributes LDAP entries.
 notes:
+  - Attribute names and values are compared with the schema of the server.
+    Names are matched case-insensitively and with their aliases, and values
+    are compared with the equality matching rule of each attribute, so
+    equivalent values never cause a write.
   - The default authentication settings will attempt to use a SASL EXTERNAL
     bind over a UNIX domain socket. This works well with the default Ubuntu
     install for example, which includes a cn=peercred,cn=external,cn=auth ACL
@@ -51,7 +55,7 @@ options:
     description:
       - The filter to search the entries to update ONLY.
   attributes:
-    required: true
+    required: false
     default: null
     description:
       - Attributes necessary to create or update an entry.
@@ -59,6 +63,51 @@ options:
         strings.
         It must contains the following key:
          - objectClass
+      - Required with I(dn) and I(search_filter). With I(src), these
+        attributes are the defaults of every entry of the file.
+  src:
+    required: false
+    default: null
+    description:
+      - File on the managed host holding the entries to add or update, in
+        LDIF, JSONL or CSV format. The file is read as a stream and the
+        entries are upserted in batches of I(batch_size), so the whole file
+        is never loaded in memory. A C(.gz) file is decompressed on the fly.
+      - Only LDIF content records are supported, not change records.
+      - Each JSONL line is either an object with the keys C(dn) and
+        C(attributes), like the lines written by M(ldap_get), or a flat
+        object of attributes with an optional C(dn) key.
+  src_format:
+    required: false
+    choices: [ldif, jsonl, csv]
+    default: null
+    description:
+      - Format of I(src). By default, it is guessed from the extension.
+  csv_mapping:
+    required: false
+    default: null
+    description:
+      - Dict of CSV column names to attribute names. Columns which are not
+        in the mapping are ignored. By default, the columns are used as
+        attribute names. The column C(dn) is always used as the dn.
+  csv_value_separator:
+    required: false
+    default: '|'
+    description:
+      - Separator of the values of a multi-valued attribute in a CSV cell.
+  dn_template:
+    required: false
+    default: null
+    description:
+      - Template of the dn of the entries of I(src) which have no dn, for
+        example C(inum={inum},ou=people,o=gluu). The fields are replaced by
+        the first value of the attributes of the entry.
+  batch_size:
+    required: false
+    default: 100
+    description:
+      - Number of entries of I(src) which are read, validated and written
+        together.
   params:
     required: false
     default: null
@@ -86,6 +135,134 @@ options:
     description:
       - If C(no), SSL certificates will not be validated. This should only be
         used on sites using self-signed certificates.
+  strategy:
+    required: false
+    choices: [read, optimistic]
+    default: read
+    description:
+      - With C(read), the entry is read first to choose between an add and
+        an update.
+      - With C(optimistic), the entry is added directly and it is only read
+        and updated when the server answers that it already exists. The
+        update is sent with the RFC 4527 pre-read and post-read controls, so
+        the old and new values are returned from the write response itself
+        in I(read_entries).
+      - C(optimistic) only applies to I(dn). It falls back to C(read) in
+        check mode.
+  sync_state:
+    required: false
+    default: null
+    description:
+      - Local state file holding the high-water mark of the last successful
+        run and a digest of the desired attributes of each entry. An entry
+        is only read and compared when its desired attributes changed, or
+        when it was changed on the server (C(modifyTimestamp) or
+        C(entryCSN) newer than the mark) or deleted since the last run.
+      - With I(base_scope), the entries changed since the mark are searched
+        once under I(base_scope) and the result is reused by the next calls
+        for I(sync_margin) seconds, so the items of a loop do not search the
+        server one by one. Entries deleted on the server are then not seen,
+        unless they are listed in I(changed_dns).
+  sync_attribute:
+    required: false
+    choices: [auto, modifyTimestamp, entryCSN]
+    default: auto
+    description:
+      - Attribute of the high-water mark. With C(auto), C(entryCSN) is used
+        when the server exposes a C(contextCSN) on I(base_scope), and
+        C(modifyTimestamp) otherwise.
+  sync_margin:
+    required: false
+    default: 300
+    description:
+      - Number of seconds subtracted from the start of the run to compute
+        the mark saved in I(sync_state).
+  changed_dns:
+    required: false
+    default: null
+    description:
+      - DNs changed on the server since the last run, like the I(dns) of
+        the journal of the gluu-ldap-watcher daemon returned by
+        C(ldap_journal), read once for the whole run. With I(sync_state),
+        the entries whose desired attributes did not change are only read
+        and compared when they are listed, without searching the server for
+        the changes.
+      - When the journal is missing or has a C(resync) record, do not set
+        it, to fall back to the high-water mark of I(sync_state).
+  revision_attribute:
+    required: false
+    default: null
+    description:
+      - Attribute holding the revision of the entry, like C(oxRevision).
+        It is increased by one with each modification of the entry, and
+        only then, and starts at 1 for a new entry, unless it is set in
+        I(attributes).
+  plan_file:
+    required: false
+    default: null
+    description:
+      - Append the changes to this plan on the managed host instead of
+        writing them, to send them later with C(ldap_apply). The entries are
+        read and compared as usual; the I(optimistic) strategy is ignored.
+  ldif_dest:
+    required: false
+    default: null
+    description:
+      - File on the managed host where the entries are rendered in LDIF
+        instead of being sent to the server, for an offline bulk import
+        (import-ldif). No connection to the server is made.
+      - The entries already in the file are kept and the entries with the
+        same dn are replaced. The file is written sorted parent-first, with
+        objectClass first and the other attributes sorted by name, so the
+        same entries always give the same file.
+      - The whole file is read and written again by each call: to render
+        many entries, give them all at once with I(src), or render them with
+        the C(gluu_ldif) filter, rather than calling the module in a loop.
+      - Not supported with I(search_filter).
+  result_format:
+    required: false
+    choices: [full, summary, counts]
+    default: full
+    description:
+      - With C(full), I(modlist) holds every changed value of every entry.
+      - With C(summary), I(changes) holds, for each entry, the operation and
+        for each attribute the kind of change and the hashes of the values.
+      - With C(counts), only I(counts) is returned.
+  result_max_bytes:
+    required: false
+    default: 1048576
+    description:
+      - Maximum size in bytes of the JSON of I(modlist) or I(changes). When
+        it is larger, the whole result is written to I(result_spill_path) on
+        the managed host and only the first entries are returned. Set to
+        C(0) to disable the limit.
+  result_spill_path:
+    required: false
+    default: null
+    description:
+      - File on the managed host where a result larger than
+        I(result_max_bytes) is written. A temporary file is used by default.
+  validate_schema:
+    required: false
+    choices: ['yes', 'no']
+    default: 'yes'
+    description:
+      - If C(yes), every entry is validated against the schema of the server
+        (known objectClass and attributes, required and allowed attributes,
+        single-valued attributes) before any write is sent.
+  schema_cache:
+    required: false
+    default: ~/.ansible/cache/ldap_schema
+    description:
+      - Directory on the managed host where the subschema of the server is
+        cached. The cache is keyed by the server and the modifyTimestamp of
+        the subschema entry. Set to an empty string to disable the cache.
+  trace_file:
+    required: false
+    default: null
+    description:
+      - File on the managed host where a JSON line is appended for each
+        LDAP operation, with its type, target and duration.
 """
 
 
@@ -106,6 +283,32 @@ EXAMPLES = """
       description: An LDAP administrator
       userPassword: "{SSHA}tabyipcHzhwESzRaGA7oQ/SDoBZQOGND"
 
+- name: Render users in a LDIF file for an offline import
+  ldap_upsert:
+    src: /root/import/users.jsonl
+    dn_template: uid={uid},ou=people,o=gluu
+    ldif_dest: /root/import/users.ldif
+    attributes:
+      objectClass:
+        - top
+        - gluuPerson
+
+- name: Import users from a CSV file on the managed host
+  ldap_upsert:
+    src: /root/import/users.csv
+    csv_mapping:
+      login: uid
+      first_name: givenName
+      last_name: sn
+      email: mail
+    dn_template: uid={uid},ou=people,o=gluu
+    attributes:
+      objectClass:
+        - top
+        - gluuPerson
+      gluuStatus: active
+    result_format: counts
+
 #
 # The same as in the previous example but with the authentication details
 # stored in the ldap_auth variable:
@@ -133,16 +336,71 @@ modlist:
   returned: success
   type: list
   sample: '[[2, "olcRootDN", ["cn=root,dc=example,dc=com"]]]'
+changes:
+  description:
+    - Summary of the changes when result_format=summary. The values are
+      replaced by their hashes.
+  returned: when result_format=summary
+  type: dict
+  sample: '{"cn=admin,dc=example,dc=com": {"operation": "modify", "attributes": {"description": {"change": "replace", "hashes": ["5d41402abc4b2a76"]}}}}'
+counts:
+  description:
+    - Number of entries added, modified and unchanged, and number of
+      entries skipped because they did not change since the last run of
+      I(sync_state).
+  returned: success
+  type: dict
+  sample: '{"add": 1, "modify": 0, "unchanged": 3, "skipped": 0}'
+spill_file:
+  description: File on the managed host holding the whole result.
+  returned: when the result is larger than result_max_bytes
+  type: str
+read_entries:
+  description:
+    - Values of the modified attributes before and after the update, as
+      returned by the pre-read and post-read controls.
+  returned: when strategy=optimistic and an existing entry is updated
+  type: dict
+  sample: '{"cn=admin,dc=example,dc=com": {"before": {"description": ["Old"]}, "after": {"description": ["New"]}}}'
+stats:
+  description:
+    - Number, total, p50, p95 and max milliseconds of each type of LDAP
+      operation (connect, bind, search, compare, add, modify). The
+      connection to the server is opened by the first operation, usually the
+      bind, and counted in its time.
+  returned: when connected to the server
+  type: dict
+  sample: '{"search": {"count": 3, "total": 4.2, "p50": 1.1, "p95": 2.5, "max": 2.5}}'
 """
 
+import base64
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import tempfile
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.pycompat24 import get_exception
-from ansible.module_utils.six import string_types
+from ansible.module_utils.six import PY2, StringIO, string_types
+from ansible.module_utils.gluu_ldap_schema import LdapSchema, to_bytes, to_text
+from ansible.module_utils.gluu_ldap_result import (
+    RESULT_FORMATS, bound_result, summarize_modlist)
+from ansible.module_utils.gluu_ldap_plan import Plan
+from ansible.module_utils.gluu_ldap_revision import revision_modlist
+from ansible.module_utils.gluu_ldap_sync import (
+    SYNC_ATTRIBUTES, SyncState, detect_sync_attribute, entry_digest)
+from ansible.module_utils.gluu_ldap_stats import LdapStats
 
 try:
     import ldap
+    import ldap.dn
     import ldap.modlist
     import ldap.sasl
+    import ldif
+    from ldap.controls.readentry import PreReadControl, PostReadControl
 
     HAS_LDAP = True
 except ImportError:
@@ -150,33 +408,24 @@ except ImportError:
 
 
 class LdapAttr(object):
-    def __init__(self, module, connection, dn, name, values):
+    def __init__(self, module, schema, dn, name, values):
         # Shortcuts
         self.module = module
-        self.connection = connection
+        self.schema = schema
         self.dn = dn
         self.name = name
 
         # Normalize values
-        if isinstance(values, list):
-            self.values = map(str, values)
-        else:
-            self.values = [str(values)]
-
-    def update(self):
-        try:
-            results = self.connection.search_s(
-                self.dn, ldap.SCOPE_BASE, attrlist=[self.name])
-        except ldap.LDAPError:
-            e = get_exception()
-            self.module.fail_json(
-                msg="Cannot search for attribute %s" % self.name,
-                details=str(e))
+        if not isinstance(values, list):
+            values = [values]
+        self.values = [to_bytes(v) for v in values if v is not None]
 
-        current = results[0][1].get(self.name, [])
+    def update(self, current_attrs):
+        """ Return the modification needed to reach self.values, if any. """
+        current = self.schema.get_values(current_attrs, self.name)
         modlist = None
 
-        if frozenset(self.values) != frozenset(current):
+        if not self.schema.same_values(self.name, self.values, current):
             if len(current) == 0:
                 modlist = (ldap.MOD_ADD, self.name, self.values)
             elif len(self.values) == 0:
@@ -188,27 +437,35 @@ class LdapAttr(object):
 
 
 class LdapEntry(object):
-    def __init__(self, module, connection, dn):
+    def __init__(self, module, connection, schema, dn, attributes=None):
         # Shortcuts
         self.module = module
         self.connection = connection
+        self.schema = schema
         self.dn = dn
 
         # Load attributes
-        self.attrs = self._load_attrs()
-
-    def _load_attrs(self):
-        """ Turn attribute's value to array. """
+        if attributes is None:
+            attributes = self.module.params['attributes']
+        self.attrs = self._load_attrs(attributes)
+        self.revision_attribute = self.module.params['revision_attribute']
+        self.current_attrs = None
+        self.read_entry = None
+        self.operation = None
+        self.modlist = []
+
+    def _load_attrs(self, attributes):
+        """ Turn attribute's value to an array of UTF-8 byte strings, as
+            python-ldap expects them. Null attributes are not managed. """
         attrs = {}
 
-        for name, value in self.module.params['attributes'].items():
-            if name not in attrs:
-                attrs[name] = []
+        for name, value in attributes.items():
+            if value is None:
+                continue
+            if not isinstance(value, list):
+                value = [value]
 
-            if isinstance(value, list):
-                attrs[name] = value
-            else:
-                attrs[name].append(str(value))
+            attrs[name] = [to_bytes(v) for v in value if v is not None]
 
         return attrs
 
@@ -216,47 +473,143 @@ class LdapEntry(object):
         """ Return if self.dn exist. """
         return self._is_entry_present()
 
+    def add_attrs(self):
+        """ Return the attributes of a new entry, starting its revision. """
+        attrs = dict(self.attrs)
+        if self._is_revision_managed():
+            attrs[self.revision_attribute] = [b'1']
+
+        return attrs
+
     def add(self):
         """ If self.dn does not exist, returns a callable that will add it. """
         def _add():
             self.connection.add_s(self.dn, modlist)
             return modlist
 
-        modlist = ldap.modlist.addModlist(self.attrs)
+        modlist = ldap.modlist.addModlist(self.add_attrs())
 
         action = None
         if modlist:
             action = _add
+            self.operation = 'add'
+            self.modlist = modlist
 
         return action
 
-    def update(self):
+    def optimistic(self):
+        """ Returns a callable that adds self.dn, or updates it if it exists.
+            The entry must be valid to add, an update is then valid too. """
+        def _optimistic():
+            try:
+                self.connection.add_s(self.dn, modlist)
+            except ldap.ALREADY_EXISTS:
+                pass
+            else:
+                self.operation = 'add'
+                self.modlist = modlist
+                return modlist
+
+            action = self.update(read_controls=True)
+            if action is None:
+                return []
+
+            return action()
+
+        modlist = ldap.modlist.addModlist(self.add_attrs())
+
+        return _optimistic
+
+    def update(self, read_controls=False):
         """ If self.dn exist, returns a callable that will update it. """
         def _update():
-            self.connection.modify_s(self.dn, modlist)
+            if not read_controls:
+                self.connection.modify_s(self.dn, modlist)
+                return modlist
+
+            attr_names = [op[1] for op in modlist]
+            msgid = self.connection.modify_ext(
+                self.dn, modlist, serverctrls=[
+                    PreReadControl(criticality=False, attrList=attr_names),
+                    PostReadControl(criticality=False, attrList=attr_names)])
+            resp_ctrls = self.connection.result3(msgid)[3]
+
+            self.read_entry = {}
+            for ctrl in resp_ctrls or []:
+                if ctrl.controlType == PreReadControl.controlType:
+                    self.read_entry['before'] = self._to_text_attrs(ctrl.entry)
+                elif ctrl.controlType == PostReadControl.controlType:
+                    self.read_entry['after'] = self._to_text_attrs(ctrl.entry)
+
             return modlist
 
+        if self.current_attrs is None:
+            self._is_entry_present()
+
         modlist = []
         for (attr_name, attr_values) in self.attrs.items():
-            ldap_attr = LdapAttr(self.module, self.connection,
+            ldap_attr = LdapAttr(self.module, self.schema,
                                  self.dn, attr_name, attr_values)
-            op = ldap_attr.update()
+            op = ldap_attr.update(self.current_attrs)
             if op:
                 modlist.append(op)
 
+        # Only increase the revision when the content changed
+        if modlist:
+            modlist.extend(self._revision_modlist())
+
         action = None
         if modlist:
             action = _update
+            self.operation = 'modify'
+            self.modlist = modlist
 
         return action
 
+    def _to_text_attrs(self, attrs):
+        return dict(
+            (name, [to_text(v) for v in values])
+            for (name, values) in (attrs or {}).items())
+
+    def validate(self):
+        """ Return the schema violations of the entry to add or update. """
+        return self.schema.validate_entry(self.attrs, self.current_attrs)
+
+    def _is_revision_managed(self):
+        """ True if the revision is bumped by the module rather than set by
+            the attributes. """
+        return bool(self.revision_attribute) and not any(
+            name.lower() == self.revision_attribute.lower()
+            for name in self.attrs)
+
+    def _revision_modlist(self):
+        """ Return the modification increasing the revision of the entry, so
+            oxAuth and oxTrust reload it without a restart. """
+        if not self._is_revision_managed():
+            return []
+
+        return revision_modlist(
+            self.revision_attribute,
+            self.schema.get_values(self.current_attrs, self.revision_attribute))
+
     def _is_entry_present(self):
+        """ Read the managed attributes of self.dn in a single search. """
+        attrlist = list(self.attrs.keys())
+        if self._is_revision_managed():
+            attrlist.append(self.revision_attribute)
+
         try:
-            self.connection.search_s(self.dn, ldap.SCOPE_BASE)
+            results = self.connection.search_s(
+                self.dn, ldap.SCOPE_BASE, attrlist=attrlist)
         except ldap.NO_SUCH_OBJECT:
             is_present = False
+        except ldap.LDAPError:
+            e = get_exception()
+            self.module.fail_json(
+                msg="Cannot search for entry %s" % self.dn, details=str(e))
         else:
             is_present = True
+            self.current_attrs = results[0][1]
 
         return is_present
 
@@ -273,23 +626,43 @@ class LdapEntries(object):
         self.dn = self.module.params['dn']
         self.base_scope = self.module.params['base_scope']
         self.search_filter = self.module.params['search_filter']
+        self.schema_cache = self.module.params['schema_cache']
+
+        # Time the operations sent to the server
+        self.stats = LdapStats(self.module.params['trace_file'])
 
         # Establish connection
         self.connection = self._connect_to_ldap()
 
-    def search_entries(self):
+        # Load the schema to compare attributes with the server rules
+        self.schema = LdapSchema.from_connection(
+            self.connection, self.server_uri, self.schema_cache)
+
+    def search_entries(self, sync=None):
         """ Search with the serach_filter and return an array of dn """
         if self.dn:
             return [self.dn]
 
+        search_filter = self.search_filter
+        if sync is not None and sync.journal_dns is None:
+            search_filter = sync.changed_filter(search_filter)
+
         try:
             result = self.connection.search_s(
-                self.base_scope, ldap.SCOPE_SUBTREE, self.search_filter)
+                self.base_scope, ldap.SCOPE_SUBTREE, search_filter,
+                attrlist=['1.1'])
         except ldap.NO_SUCH_OBJECT:
             result = None
         else:
             # Get dn for each entry
-            result = [res[0] for res in result]
+            result = [res[0] for res in result if res[0] is not None]
+            if sync is not None and sync.journal_dns is not None:
+                result = [
+                    dn for dn in result if dn.lower() in sync.journal_dns]
+
+        if not result and sync is not None and sync.mark is not None:
+            # Nothing has changed since the last run
+            return []
 
         if not result:
             self.module.fail_json(
@@ -298,11 +671,63 @@ class LdapEntries(object):
 
         return result
 
+    def changed_since_mark(self, sync, dns):
+        """ Return the dns changed or deleted since the mark of sync. """
+        if not dns or sync.mark is None:
+            return dns
+
+        if sync.journal_dns is not None:
+            return [dn for dn in dns if dn.lower() in sync.journal_dns]
+
+        # Search the changed entries once for the run, or the entries one by
+        # one without a base
+        if self.base_scope:
+            changes = sync.cached_changes(self.server_uri, self.base_scope)
+            if changes is None:
+                changes = self._search_changes(sync)
+                sync.cache_changes(self.server_uri, self.base_scope, changes)
+
+            return [dn for dn in dns if dn.lower() in changes]
+
+        found = {}
+        for dn in dns:
+            try:
+                results = self.connection.search_s(
+                    dn, ldap.SCOPE_BASE, '(objectClass=*)',
+                    attrlist=[sync.attribute])
+            except ldap.NO_SUCH_OBJECT:
+                continue
+
+            for (dn_found, attrs) in results:
+                if dn_found is not None:
+                    found[dn_found.lower()] = self.schema.get_values(
+                        attrs, sync.attribute)
+
+        changed = []
+        for dn in dns:
+            marks = [to_text(v) for v in found.get(dn.lower(), [])]
+            # Compare the date part, common to modifyTimestamp and entryCSN
+            if not marks or max(marks)[:14] >= sync.mark[:14]:
+                changed.append(dn)
+
+        return changed
+
+    def _search_changes(self, sync):
+        """ Return the lowercased dns changed under base_scope since the mark. """
+        try:
+            results = self.connection.search_s(
+                self.base_scope, ldap.SCOPE_SUBTREE, sync.changed_filter(),
+                attrlist=['1.1'])
+        except ldap.NO_SUCH_OBJECT:
+            return set()
+
+        return set(dn.lower() for (dn, attrs) in results if dn is not None)
+
     def _connect_to_ldap(self):
         if not self.verify_cert:
             ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
 
-        connection = ldap.initialize(self.server_uri)
+        connection = self.stats.initialize(self.server_uri)
 
         if self.start_tls:
             try:
@@ -324,6 +749,398 @@ class LdapEntries(object):
         return connection
 
 
+class EntrySource(object):
+    """ Read the entries of I(src) one by one, without loading the file. """
+    def __init__(self, module):
+        self.module = module
+        self.src = module.params['src']
+        self.src_format = module.params['src_format']
+        self.csv_mapping = module.params['csv_mapping']
+        self.csv_value_separator = module.params['csv_value_separator']
+        self.dn_template = module.params['dn_template']
+        self.defaults = module.params['attributes']
+
+        if self.src_format is None:
+            name = self.src[:-3] if self.src.endswith('.gz') else self.src
+            self.src_format = os.path.splitext(name)[1].lstrip('.').lower()
+
+        if self.src_format not in ['ldif', 'jsonl', 'csv']:
+            self.module.fail_json(
+                msg="Cannot guess the format of %s, set src_format." % self.src)
+
+        if not os.path.exists(self.src):
+            self.module.fail_json(msg="Source file %s not found." % self.src)
+
+    def entries(self):
+        """ Yield (dn, attributes) for each entry of the source file. """
+        f = self._open()
+        try:
+            if self.src_format == 'ldif':
+                records = self._read_ldif(f)
+            elif self.src_format == 'jsonl':
+                records = self._read_jsonl(f)
+            else:
+                records = self._read_csv(f)
+
+            for (dn, attrs) in records:
+                yield self._complete_entry(dn, attrs)
+        finally:
+            f.close()
+
+    def _open(self):
+        # The csv module of python 2 only reads byte strings
+        if PY2 and self.src_format == 'csv':
+            if self.src.endswith('.gz'):
+                return gzip.open(self.src, 'rb')
+            return open(self.src, 'rb')
+
+        if self.src.endswith('.gz'):
+            return io.TextIOWrapper(gzip.open(self.src, 'rb'), encoding='utf-8')
+
+        return io.open(self.src, encoding='utf-8')
+
+    def _read_ldif(self, f):
+        """ Parse the LDIF content records one at a time. """
+        lines = []
+        for line in itertools.chain(f, ['\n']):
+            if line.rstrip('\r\n'):
+                if not line.startswith('#'):
+                    lines.append(line)
+                continue
+
+            if lines and lines[0].lower().startswith('version:'):
+                lines = lines[1:]
+
+            if lines:
+                parser = ldif.LDIFRecordList(StringIO(''.join(lines)))
+                parser.parse()
+                for (dn, attrs) in parser.all_records:
+                    yield (dn, attrs)
+
+            lines = []
+
+    def _read_jsonl(self, f):
+        for (idx, line) in enumerate(f):
+            if not line.strip():
+                continue
+
+            try:
+                record = json.loads(line)
+            except ValueError:
+                e = get_exception()
+                self.module.fail_json(
+                    msg="Invalid JSON on line %d of %s." % (idx + 1, self.src),
+                    details=str(e))
+
+            # Accept the lines written by ldap_get and flat objects
+            if 'attributes' in record:
+                attrs = dict(record['attributes'])
+                for (name, values) in record.get('base64', {}).items():
+                    attrs.setdefault(name, []).extend(
+                        base64.b64decode(v) for v in values)
+            else:
+                attrs = dict(
+                    (k, v) for (k, v) in record.items() if k != 'dn')
+
+            yield (record.get('dn'), attrs)
+
+    def _read_csv(self, f):
+        for row in csv.DictReader(f):
+            attrs = {}
+            dn = row.get('dn')
+
+            for (column, value) in row.items():
+                if column == 'dn' or column is None or value in [None, '']:
+                    continue
+
+                if self.csv_mapping is not None:
+                    if column not in self.csv_mapping:
+                        continue
+                    name = self.csv_mapping[column]
+                else:
+                    name = column
+
+                values = value.split(self.csv_value_separator)
+                attrs[name] = values if len(values) > 1 else values[0]
+
+            yield (dn, attrs)
+
+    def _complete_entry(self, dn, attrs):
+        """ Merge the default attributes and build the dn if needed. """
+        attributes = dict(self.defaults)
+        attributes.update(attrs)
+
+        # Same type of string as the dn given in the module parameters
+        if dn is not None and not isinstance(dn, str):
+            dn = dn.encode('utf-8') if PY2 else dn.decode('utf-8')
+
+        if not dn and self.dn_template:
+            # Same type of string as the template
+            values = dict(
+                (name, value[0] if isinstance(value, list) else value)
+                for (name, value) in attributes.items())
+            values = dict(
+                (name, to_bytes(value) if PY2 else to_text(value))
+                for (name, value) in values.items())
+            try:
+                dn = self.dn_template.format(**values)
+            except KeyError:
+                e = get_exception()
+                self.module.fail_json(
+                    msg="Missing attribute %s to build the dn." % str(e),
+                    attributes=attrs)
+
+        if not dn:
+            self.module.fail_json(
+                msg="An entry of %s has no dn, set dn_template." % self.src,
+                attributes=attrs)
+
+        if 'objectClass' not in attributes:
+            self.module.fail_json(
+                msg="At least one objectClass must be provided.", dn=dn)
+
+        return (dn, attributes)
+
+
+class LdifDestination(object):
+    """ Render the entries in a LDIF file instead of sending them. """
+    def __init__(self, module):
+        self.module = module
+        self.path = module.params['ldif_dest']
+        self.entries = {}
+        self.content = None
+
+        if os.path.exists(self.path):
+            with io.open(self.path, encoding='utf-8') as f:
+                self.content = f.read()
+
+            parser = ldif.LDIFRecordList(StringIO(self.content))
+            parser.parse()
+            for (dn, attrs) in parser.all_records:
+                self.entries[self._dn_key(dn)] = (dn, dict(
+                    (name, [to_text(v) for v in values])
+                    for (name, values) in attrs.items()))
+
+    def upsert(self, ldap_entry):
+        """ Add or replace an entry and record the change on ldap_entry. """
+        key = self._dn_key(ldap_entry.dn)
+
+        # Null attributes are not loaded by LdapEntry, skip the empty ones
+        attrs = dict(
+            (name, [to_text(v) for v in values])
+            for (name, values) in ldap_entry.add_attrs().items()
+            if values)
+
+        if key not in self.entries:
+            ldap_entry.operation = 'add'
+            ldap_entry.modlist = ldap.modlist.addModlist(attrs)
+        elif self.entries[key][1] != attrs:
+            ldap_entry.operation = 'modify'
+            ldap_entry.modlist = ldap.modlist.modifyModlist(
+                self.entries[key][1], attrs)
+
+        self.entries[key] = (ldap_entry.dn, attrs)
+
+    def write(self):
+        """ Write the file if its content has changed. """
+        content = '\n'.join(
+            self._render_entry(*self.entries[key])
+            for key in sorted(self.entries))
+
+        if content == self.content:
+            return False
+
+        if not self.module.check_mode:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.path)),
+                prefix='.%s.' % os.path.basename(self.path))
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                f.write(to_text(content))
+            os.rename(tmp_path, self.path)
+
+        return True
+
+    def _render_entry(self, dn, attrs):
+        lines = [self._render_line('dn', dn)]
+
+        names = sorted(
+            attrs, key=lambda n: (n.lower() != 'objectclass', n.lower()))
+        for name in names:
+            for value in attrs[name]:
+                lines.append(self._render_line(name, to_text(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def _render_line(self, name, value):
+        """ Render an attribute line, base64-encoded when needed (RFC 2849). """
+        if value and (
+                value[0] in [' ', ':', '<'] or value[-1] == ' ' or
+                any(c in ['\0', '\n', '\r'] or ord(c) > 127 for c in value)):
+            line = name + ':: ' + base64.b64encode(
+                value.encode('utf-8')).decode('ascii')
+        else:
+            line = name + ': ' + value
+
+        # Fold the lines longer than 76 characters
+        folded = [line[:76]]
+        for idx in range(76, len(line), 75):
+            folded.append(' ' + line[idx:idx + 75])
+
+        return '\n'.join(folded)
+
+    def _dn_key(self, dn):
+        """ Sort the parents before their children, then by reversed dn. """
+        rdns = [
+            '+'.join(sorted('%s=%s' % (attr.lower(), val.lower())
+                            for (attr, val, flags) in rdn))
+            for rdn in ldap.dn.str2dn(dn)]
+        rdns.reverse()
+
+        return (len(rdns), tuple(rdns))
+
+
+class UpsertResult(object):
+    """ Accumulate the changes of the entries for the module result. """
+    def __init__(self, module):
+        self.module = module
+        self.result_format = module.params['result_format']
+        self.counts = {'add': 0, 'modify': 0, 'unchanged': 0, 'skipped': 0}
+        self.modlist = {}
+        self.changes = {}
+        self.read_entries = {}
+
+    def record(self, ldap_entry):
+        if ldap_entry.read_entry is not None and self.result_format == 'full':
+            self.read_entries[ldap_entry.dn] = ldap_entry.read_entry
+
+        if not ldap_entry.modlist:
+            self.counts['unchanged'] += 1
+            return
+
+        self.counts[ldap_entry.operation] += 1
+        if self.result_format == 'full':
+            self.modlist[ldap_entry.dn] = ldap_entry.modlist
+        elif self.result_format == 'summary':
+            self.changes[ldap_entry.dn] = summarize_modlist(
+                ldap_entry.operation, ldap_entry.modlist)
+
+    def to_result(self):
+        result = dict(
+            changed=(self.counts['add'] + self.counts['modify'] > 0),
+            counts=self.counts)
+
+        if self.result_format == 'full':
+            result['modlist'], extra = bound_result(
+                self.modlist, self.module.params['result_max_bytes'],
+                self.module.params['result_spill_path'])
+            result.update(extra)
+        elif self.result_format == 'summary':
+            result['changes'], extra = bound_result(
+                self.changes, self.module.params['result_max_bytes'],
+                self.module.params['result_spill_path'])
+            result.update(extra)
+
+        if self.read_entries:
+            result['read_entries'] = self.read_entries
+
+        return result
+
+
+def select_changed(ldap_entries, sync, batch, result):
+    """ Keep the entries of a batch which changed since the last run. """
+    digests = dict(
+        (dn_entry, entry_digest(attributes)) for (dn_entry, attributes) in batch)
+    known = [
+        dn_entry for (dn_entry, attributes) in batch
+        if sync.is_known(dn_entry, digests[dn_entry])]
+
+    changed = set(
+        dn_entry.lower() for dn_entry in ldap_entries.changed_since_mark(
+            sync, known))
+
+    selected = []
+    for (dn_entry, attributes) in batch:
+        if dn_entry in known and dn_entry.lower() not in changed:
+            result.counts['skipped'] += 1
+        else:
+            selected.append((dn_entry, attributes))
+
+    return selected, digests
+
+
+def upsert_batch(module, ldap_entries, batch, optimistic, result, sync=None):
+    """ Compute and validate the actions of a batch, then perform them. """
+    digests = {}
+    if sync is not None:
+        batch, digests = select_changed(ldap_entries, sync, batch, result)
+
+    actions = []
+    schema_errors = {}
+    for (dn_entry, attributes) in batch:
+        # Instantiate the LdapEntry object
+        ldap_entry = LdapEntry(module, ldap_entries.connection,
+                               ldap_entries.schema, dn_entry, attributes)
+
+        # Get the action function, validated before any write of the batch
+        if optimistic and not (
+                module.params['validate_schema'] and ldap_entry.validate()):
+            actions.append((ldap_entry, ldap_entry.optimistic()))
+            continue
+        # An entry which is not valid to add may still be a valid update
+        elif ldap_entry.exists():
+            action = ldap_entry.update()
+        else:
+            action = ldap_entry.add()
+
+        if action is not None and module.params['validate_schema']:
+            errors = ldap_entry.validate()
+            if errors:
+                schema_errors[dn_entry] = errors
+
+        actions.append((ldap_entry, action))
+
+    # Do not send any write of the batch if an entry is invalid
+    if schema_errors:
+        module.fail_json(
+            msg="Entries do not match the schema of the server.",
+            errors=schema_errors, counts=result.counts)
+
+    plan = None
+    if module.params['plan_file']:
+        plan = Plan(module.params['plan_file'])
+
+    for (ldap_entry, action) in actions:
+        # Record the action in the plan instead of performing it
+        if action is not None and plan is not None:
+            if not module.check_mode:
+                plan.append(
+                    ldap_entry.dn, ldap_entry.operation, ldap_entry.modlist)
+        # Perform the action
+        elif action is not None and not module.check_mode:
+            try:
+                action()
+            except Exception:
+                e = get_exception()
+                # module.fail_json(msg="Entry action failed.", details=str(e))
+                module.fail_json(
+                    msg="Entry action failed.", details=e, dn=ldap_entry.dn,
+                    counts=result.counts)
+
+        result.record(ldap_entry)
+
+    if sync is not None and not module.check_mode and plan is None:
+        for (dn_entry, digest) in digests.items():
+            sync.remember(dn_entry, digest)
+
+
+def render_batch(module, destination, batch, result):
+    """ Render a batch of entries in the LDIF destination. """
+    for (dn_entry, attributes) in batch:
+        ldap_entry = LdapEntry(module, None, None, dn_entry, attributes)
+        destination.upsert(ldap_entry)
+        result.record(ldap_entry)
+
+
 def main():
     module = AnsibleModule(
         argument_spec={
@@ -335,10 +1152,31 @@ def main():
             'dn': dict(),
             'base_scope': dict(),
             'search_filter': dict(),
-            'attributes': dict(required=True, type='dict'),
+            'attributes': dict(type='dict'),
             'params': dict(type='dict'),
+            'trace_file': dict(type='path'),
+            'src': dict(type='path'),
+            'src_format': dict(choices=['ldif', 'jsonl', 'csv']),
+            'csv_mapping': dict(type='dict'),
+            'csv_value_separator': dict(default='|'),
+            'dn_template': dict(),
+            'batch_size': dict(default=100, type='int'),
+            'ldif_dest': dict(type='path'),
+            'sync_state': dict(type='path'),
+            'sync_attribute': dict(default='auto', choices=SYNC_ATTRIBUTES),
+            'sync_margin': dict(default=300, type='int'),
+            'changed_dns': dict(type='list'),
+            'plan_file': dict(type='path'),
+            'revision_attribute': dict(),
+            'strategy': dict(default='read', choices=['read', 'optimistic']),
+            'result_format': dict(default='full', choices=RESULT_FORMATS),
+            'result_max_bytes': dict(default=1048576, type='int'),
+            'result_spill_path': dict(type='path'),
+            'validate_schema': dict(default=True, type='bool'),
+            'schema_cache': dict(default='~/.ansible/cache/ldap_schema'),
         },
-        required_one_of=[['dn', 'search_filter']],
+        required_one_of=[['dn', 'search_filter', 'src']],
+        mutually_exclusive=[['dn', 'search_filter', 'src']],
         supports_check_mode=True,
     )
 
@@ -346,13 +1184,19 @@ def main():
         module.fail_json(
             msg="Missing required 'ldap' module (pip install python-ldap).")
 
-    # Check if objectClass is present when needed
-    if 'objectClass' not in module.params['attributes']:
+    if module.params['attributes'] is None:
+        if not module.params['src']:
+            module.fail_json(msg="attributes is required with dn or search_filter.")
+        module.params['attributes'] = {}
+
+    # Check if objectClass is present when needed (checked for each entry
+    # when it is read from src)
+    if not module.params['src'] and 'objectClass' not in module.params['attributes']:
         module.fail_json(msg="At least one objectClass must be provided.")
 
     # Check if objectClass is of the correct type
     if (
-            module.params['attributes']['objectClass'] is not None and not (
+            module.params['attributes'].get('objectClass') is not None and not (
                 isinstance(module.params['attributes']['objectClass'], string_types) or
                 isinstance(module.params['attributes']['objectClass'], list))):
         module.fail_json(msg="objectClass must be either a string or a list.")
@@ -368,36 +1212,97 @@ def main():
         # Remove the params
         module.params.pop('params', None)
 
-    # Instantiate the LdapEntries object
-    ldap_entries = LdapEntries(module)
-
-    # Search for all entries
-    entries = ldap_entries.search_entries()
+    # Render the entries in a LDIF file without connecting to the server
+    if module.params['ldif_dest']:
+        if module.params['search_filter']:
+            module.fail_json(msg="ldif_dest cannot be used with search_filter.")
 
-    entries_modlist = {}
-    for dn_entry in entries:
-        # Instantiate the LdapEntry object
-        ldap_entry = LdapEntry(module, ldap_entries.connection, dn_entry)
+        destination = LdifDestination(module)
+        result = UpsertResult(module)
 
-        # Get the action function
-        if ldap_entry.exists():
-            action = ldap_entry.update()
+        if module.params['src']:
+            entries = EntrySource(module).entries()
         else:
-            action = ldap_entry.add()
+            entries = [(module.params['dn'], module.params['attributes'])]
 
-        # Perform the action
-        if action is not None and not module.check_mode:
-            try:
-                modlist = action()
-            except Exception:
-                e = get_exception()
-                # module.fail_json(msg="Entry action failed.", details=str(e))
-                module.fail_json(msg="Entry action failed.", details=e)
-            else:
-                entries_modlist[dn_entry] = modlist
+        render_batch(module, destination, entries, result)
+
+        changed = destination.write()
+        module.exit_json(**dict(result.to_result(), changed=changed))
+
+    # Instantiate the LdapEntries object
+    ldap_entries = LdapEntries(module)
 
-    count_modlist = sum(len(v) for v in entries_modlist.items())
-    module.exit_json(changed=(count_modlist > 0), modlist=entries_modlist)
+    # Add first and only read the entry when it already exists
+    optimistic = (
+        module.params['strategy'] == 'optimistic' and
+        (module.params['dn'] or module.params['src']) and
+        not module.check_mode and not module.params['plan_file'])
+
+    result = UpsertResult(module)
+
+    sync = None
+    if module.params['sync_state']:
+        base = module.params['base_scope'] or module.params['dn'] or ''
+        attribute = module.params['sync_attribute']
+        if attribute == 'auto':
+            attribute = detect_sync_attribute(ldap_entries.connection, base)
+        sync = SyncState(
+            module.params['sync_state'],
+            '|'.join([
+                ldap_entries.server_uri, base,
+                module.params['search_filter'] or module.params['dn'] or
+                module.params['src']]),
+            attribute, module.params['sync_margin'])
+
+        if module.params['changed_dns'] is not None:
+            sync.journal_dns = set(
+                to_text(dn).lower() for dn in module.params['changed_dns'])
+    elif module.params['changed_dns'] is not None:
+        module.fail_json(msg="sync_state is required with changed_dns.")
+
+    if module.params['src']:
+        # Stream the entries of the source file in bounded batches
+        source = EntrySource(module)
+        batch = []
+        for (dn_entry, attributes) in source.entries():
+            batch.append((dn_entry, attributes))
+            if len(batch) >= module.params['batch_size']:
+                upsert_batch(
+                    module, ldap_entries, batch, optimistic, result, sync)
+                batch = []
+
+        if batch:
+            upsert_batch(module, ldap_entries, batch, optimistic, result, sync)
+    elif module.params['dn']:
+        upsert_batch(
+            module, ldap_entries,
+            [(module.params['dn'], module.params['attributes'])],
+            optimistic, result, sync)
+    else:
+        # Only search the entries changed since the last run, as long as
+        # the desired attributes did not change
+        filter_sync = None
+        digest = entry_digest(module.params['attributes'])
+        if sync is not None and sync.is_known(
+                module.params['search_filter'], digest):
+            filter_sync = sync
+
+        # Search for all entries
+        entries = ldap_entries.search_entries(filter_sync)
+
+        upsert_batch(
+            module, ldap_entries,
+            [(dn_entry, module.params['attributes']) for dn_entry in entries],
+            optimistic, result)
+
+        if sync is not None and not module.check_mode and not module.params['plan_file']:
+            sync.remember(module.params['search_filter'], digest)
+
+    if sync is not None and not module.check_mode and not module.params['plan_file']:
+        sync.save()
+
+    module.exit_json(stats=ldap_entries.stats.summary(), **result.to_result())
 
 
 if __name__ == '__main__':
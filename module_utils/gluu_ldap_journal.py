@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Journal of the changes made on the LDAP server, written by the
+# gluu-ldap-watcher daemon (files/gluu-ldap-watcher.py) and read by the
+# LDAP modules to only reconcile the entries changed outside of Ansible.
+#
+# The journal is a JSONL file, one change per line:
+#   {"time": "...", "change": "add|modify|delete|moddn", "dn": "..."}
+# A "resync" record means that changes may have been lost (watcher started
+# or reconnected without a sync cookie) and that every entry must be checked.
+
+import fcntl
+import json
+import os
+
+
+JOURNAL_CHANGES = ['add', 'modify', 'delete', 'moddn', 'resync']
+
+
+class JournalLock(object):
+    """ Exclusive lock shared with the watcher, held on a separate file
+        since the journal itself is replaced when it is consumed. """
+    def __init__(self, path):
+        self.path = '%s.lock' % path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = open(self.path, 'a')
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.fd.close()
+        self.fd = None
+
+
+class Journal(object):
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def read(self):
+        """ Return the records of the journal and the offset after the last
+            complete line, to consume exactly what has been read. """
+        records = []
+        offset = 0
+
+        if not self.exists():
+            return records, offset
+
+        with JournalLock(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    # Ignore a line still being written
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line.decode('utf-8')))
+                    except ValueError:
+                        continue
+
+        return records, offset
+
+    def consume(self, offset):
+        """ Remove the first offset bytes of the journal, keeping the records
+            appended by the watcher since they have been read. """
+        if not self.exists() or offset <= 0:
+            return False
+
+        with JournalLock(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                remaining = f.read()
+
+            tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(remaining)
+            os.rename(tmp_path, self.path)
+
+        return True
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Change plan of the LDAP modules: with plan_file, ldap_upsert and
+# ldap_attr_custom compute their changes against the server as usual but
+# append them to a plan on the managed host instead of writing them, and
+# ldap_apply sends the whole plan later.
+#
+# The plan is a JSONL file, one entry per line:
+#   {"dn": "...", "op": "add", "changes": [[name, [values]], ...]}
+#   {"dn": "...", "op": "modify", "changes": [[mod_op, name, [values]], ...]}
+# Values which are not UTF-8 are stored as {"base64": "..."}.
+
+import base64
+import fcntl
+import json
+import os
+
+
+def _encode_value(value):
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return {'base64': base64.b64encode(value).decode('ascii')}
+
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value['base64'])
+    if not isinstance(value, bytes):
+        return value.encode('utf-8')
+
+    return value
+
+
+def _encode_values(values):
+    if values is None:
+        return None
+
+    return [_encode_value(v) for v in values]
+
+
+def _decode_values(values):
+    if values is None:
+        return None
+
+    return [_decode_value(v) for v in values]
+
+
+def encode_change(dn, operation, modlist):
+    """ Return the plan record of an add or a modify operation. """
+    if operation == 'add':
+        changes = [[name, _encode_values(values)] for (name, values) in modlist]
+    else:
+        changes = [
+            [mod_op, name, _encode_values(values)]
+            for (mod_op, name, values) in modlist]
+
+    return {'dn': dn, 'op': operation, 'changes': changes}
+
+
+def decode_change(record):
+    """ Return the dn, the operation and the modlist of a plan record. """
+    if record['op'] == 'add':
+        modlist = [
+            (name, _decode_values(values))
+            for (name, values) in record['changes']]
+    else:
+        modlist = [
+            (mod_op, name, _decode_values(values))
+            for (mod_op, name, values) in record['changes']]
+
+    return record['dn'], record['op'], modlist
+
+
+class Plan(object):
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def append(self, dn, operation, modlist):
+        """ Append a change to the plan, under a lock since several modules
+            can run on the same host at the same time. """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        line = json.dumps(
+            encode_change(dn, operation, modlist),
+            sort_keys=True, separators=(',', ':'))
+
+        with open(self.path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line + '\n')
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def records(self):
+        """ Iterate over the changes of the plan, in order. """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Helpers shared by the LDAP modules of the role to keep the results sent back
+# to the controller small: summaries of the changes with hashes of the values
+# instead of the values, and a hard cap on the size of the result.
+
+import hashlib
+import json
+import os
+import tempfile
+
+from ansible.module_utils.six import text_type
+
+try:
+    import ldap
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+RESULT_FORMATS = ['full', 'summary', 'counts']
+
+
+def to_json_safe(data):
+    """ Turn bytes and tuples of data into types which can be dumped in JSON. """
+    if isinstance(data, bytes):
+        return data.decode('utf-8', 'replace')
+    elif isinstance(data, dict):
+        return dict((to_json_safe(k), to_json_safe(v)) for k, v in data.items())
+    elif isinstance(data, (list, tuple)):
+        return [to_json_safe(v) for v in data]
+
+    return data
+
+
+def value_hash(value):
+    """ Return a short hash of an attribute value. """
+    if not isinstance(value, bytes):
+        if not isinstance(value, text_type):
+            value = text_type(value)
+        value = value.encode('utf-8')
+
+    return hashlib.sha1(value).hexdigest()[:16]
+
+
+def summarize_modlist(operation, modlist):
+    """ Summarize the modlist of an add or a modify operation.
+
+    The values are replaced by their hashes, so secrets and large values like
+    oxScript are never sent back to the controller.
+    """
+    changes = {}
+
+    for op in modlist:
+        if operation == 'add':
+            (name, values), kind = op, 'add'
+        else:
+            (mod_op, name, values) = op
+            kind = {
+                ldap.MOD_ADD: 'add',
+                ldap.MOD_DELETE: 'delete',
+                ldap.MOD_REPLACE: 'replace',
+            }.get(mod_op, str(mod_op))
+
+        if values is None:
+            values = []
+        elif not isinstance(values, (list, tuple)):
+            values = [values]
+
+        changes[name] = {
+            'change': kind,
+            'hashes': [value_hash(v) for v in values],
+        }
+
+    return {'operation': operation, 'attributes': changes}
+
+
+def summarize_entry(attrs):
+    """ Summarize the attributes of an entry with the hashes of its values. """
+    return dict(
+        (name, [value_hash(v) for v in values])
+        for (name, values) in attrs.items())
+
+
+def bound_result(data, max_bytes, spill_path=None):
+    """ Keep the JSON size of data under max_bytes.
+
+    When data is too large, it is written entirely to spill_path (or to a
+    temporary file) on the managed host and only the first keys or items
+    which fit are kept. Returns the kept data and the extra result keys.
+    """
+    data = to_json_safe(data)
+
+    if not max_bytes:
+        return data, {}
+
+    serialized = json.dumps(data)
+    if len(serialized) <= max_bytes:
+        return data, {}
+
+    if spill_path:
+        spill_path = os.path.expanduser(spill_path)
+        spill_file = open(spill_path, 'w')
+    else:
+        fd, spill_path = tempfile.mkstemp(prefix='ldap_result_', suffix='.json')
+        spill_file = os.fdopen(fd, 'w')
+
+    with spill_file:
+        spill_file.write(serialized)
+
+    if isinstance(data, dict):
+        kept = {}
+        items = [(k, data[k]) for k in sorted(data)]
+    else:
+        kept = []
+        items = list(enumerate(data))
+
+    size = 2
+    for (key, value) in items:
+        size += len(json.dumps(value)) + len(json.dumps(key)) + 4
+        if size > max_bytes:
+            break
+
+        if isinstance(kept, dict):
+            kept[key] = value
+        else:
+            kept.append(value)
+
+    return kept, {
+        'truncated': True,
+        'spill_file': spill_path,
+        'total_items': len(items),
+    }
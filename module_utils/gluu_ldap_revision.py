@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Revision of the configuration entries of the role: oxAuth and oxTrust reload
+# an entry without a restart when its revision (oxRevision) increases, so the
+# LDAP modules increase it together with any change of the content.
+
+from ansible.module_utils.gluu_ldap_schema import to_bytes, to_text
+
+try:
+    import ldap
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+def revision_modlist(name, current):
+    """ Return the modification increasing the revision, from the values of
+        the attribute returned by the server. """
+    if not current:
+        return [(ldap.MOD_ADD, name, [b'1'])]
+
+    try:
+        revision = int(to_text(current[0]))
+    except ValueError:
+        return [(ldap.MOD_REPLACE, name, [b'1'])]
+
+    # Delete the value read, as returned by the server, so a concurrent
+    # increase makes the modification fail instead of being lost
+    return [
+        (ldap.MOD_DELETE, name, [current[0]]),
+        (ldap.MOD_ADD, name, [to_bytes(revision + 1)])]
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Helpers shared by the LDAP modules of the role to compare attribute names
+# and values with the rules defined in the schema of the server, and to
+# validate entries before sending them.
+
+import hashlib
+import json
+import os
+
+from ansible.module_utils.six import text_type
+
+try:
+    import ldap
+    import ldap.dn
+    import ldap.schema
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+# Equality matching rules handled in Python. Any other rule (octetStringMatch,
+# generalizedTimeMatch, ...) is compared byte for byte.
+CASE_IGNORE_RULES = [
+    'caseignorematch', 'caseignoreia5match', 'caseignorelistmatch',
+    'caseignoresubstringsmatch',
+]
+CASE_EXACT_RULES = [
+    'caseexactmatch', 'caseexactia5match',
+]
+DN_RULES = [
+    'distinguishednamematch', 'uniquemembermatch',
+]
+
+
+def to_text(value):
+    """ Return value as a text string. """
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+
+    return value
+
+
+def to_bytes(value):
+    """ Return value as a UTF-8 byte string, as python-ldap expects the
+        attribute values. """
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, text_type):
+        value = text_type(value)
+
+    return value.encode('utf-8')
+
+
+class LdapSchema(object):
+    def __init__(self, subschema=None):
+        self.subschema = subschema
+        self._rules = {}
+
+    @classmethod
+    def from_connection(cls, connection, server_uri=None, cache_dir=None):
+        """ Load the subschema of the server, if it can be read.
+
+        When cache_dir is set, the subschema is stored on disk, keyed by the
+        server and the modifyTimestamp of the subschema entry, and it is only
+        read again from the server when the schema has been modified.
+        """
+        try:
+            subschema_dn = connection.search_subschemasubentry_s()
+            entry = None
+            if subschema_dn:
+                entry = cls._read_subschema(
+                    connection, subschema_dn, server_uri, cache_dir)
+        except ldap.LDAPError:
+            entry = None
+
+        if not entry:
+            return cls()
+
+        return cls(ldap.schema.SubSchema(entry))
+
+    @classmethod
+    def _read_subschema(cls, connection, subschema_dn, server_uri, cache_dir):
+        cache_path = None
+
+        if cache_dir:
+            results = connection.search_s(
+                subschema_dn, ldap.SCOPE_BASE, '(objectClass=*)',
+                attrlist=['modifyTimestamp'])
+            timestamp = results[0][1].get('modifyTimestamp') if results else None
+
+            if timestamp:
+                key = '%s|%s|%s' % (
+                    server_uri, subschema_dn, to_text(timestamp[0]))
+                cache_path = os.path.join(
+                    os.path.expanduser(cache_dir),
+                    hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    return json.load(f)
+            except (IOError, ValueError):
+                pass
+
+        entry = connection.read_subschemasubentry_s(subschema_dn)
+
+        if cache_path and entry:
+            entry = dict(
+                (name, [to_text(v) for v in values])
+                for (name, values) in entry.items())
+            cls._write_cache(cache_path, entry)
+
+        return entry
+
+    @staticmethod
+    def _write_cache(cache_path, entry):
+        """ Write the cache file atomically, ignoring any error. """
+        try:
+            if not os.path.isdir(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path))
+
+            tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError):
+            pass
+
+    def attribute_key(self, name):
+        """ Return a key identifying the attribute whatever its alias or case. """
+        name = name.split(';')[0].strip()
+
+        if self.subschema is not None:
+            oid = self.subschema.getoid(ldap.schema.AttributeType, name)
+            if oid != name:
+                return oid
+
+        return name.lower()
+
+    def equality(self, name):
+        """ Return the equality matching rule of the attribute. """
+        key = self.attribute_key(name)
+
+        if key not in self._rules:
+            rule = None
+            if self.subschema is not None:
+                try:
+                    rule = self.subschema.get_inheritedattr(
+                        ldap.schema.AttributeType, key, 'equality')
+                except KeyError:
+                    rule = None
+            elif key == 'objectclass':
+                rule = 'objectIdentifierMatch'
+
+            self._rules[key] = rule.lower() if rule else None
+
+        return self._rules[key]
+
+    def normalize(self, name, value):
+        """ Normalize a value with the equality rule of the attribute. """
+        value = to_text(value)
+        rule = self.equality(name)
+
+        if rule in CASE_IGNORE_RULES:
+            return ' '.join(value.split()).lower()
+        elif rule in CASE_EXACT_RULES:
+            return ' '.join(value.split())
+        elif rule in DN_RULES:
+            return self._normalize_dn(value)
+        elif rule == 'integermatch':
+            try:
+                return str(int(value.strip()))
+            except ValueError:
+                return value
+        elif rule == 'booleanmatch':
+            return value.strip().upper()
+        elif rule == 'numericstringmatch':
+            return ''.join(value.split())
+        elif rule == 'telephonenumbermatch':
+            return ''.join(value.replace('-', ' ').split()).lower()
+        elif rule == 'objectidentifiermatch':
+            return self._normalize_oid(value)
+
+        return value
+
+    def get_values(self, attrs, name):
+        """ Return the values of attribute name in attrs, returned by the server. """
+        key = self.attribute_key(name)
+        values = []
+
+        for attr_name, attr_values in attrs.items():
+            if self.attribute_key(attr_name) == key:
+                values.extend(attr_values)
+
+        return values
+
+    def same_values(self, name, values, current):
+        """ True if both lists of values are equivalent for the attribute. """
+        return (frozenset(self.normalize(name, v) for v in values) ==
+                frozenset(self.normalize(name, v) for v in current))
+
+    def missing_values(self, name, values, current):
+        """ Return the values which are not equivalent to a current value. """
+        current = frozenset(self.normalize(name, v) for v in current)
+
+        return [v for v in values if self.normalize(name, v) not in current]
+
+    def present_values(self, name, values, current):
+        """ Return the values which are equivalent to a current value. """
+        current = frozenset(self.normalize(name, v) for v in current)
+
+        return [v for v in values if self.normalize(name, v) in current]
+
+    def validate_entry(self, attrs, current_attrs=None):
+        """ Return the list of schema violations of an entry.
+
+        attrs holds the attributes to send. When the entry already exists,
+        current_attrs holds its current attributes, which can satisfy the
+        required attributes not managed by attrs.
+        """
+        if self.subschema is None:
+            return []
+
+        errors = []
+        object_classes = []
+
+        for name, values in attrs.items():
+            if self.attribute_key(name) == self.attribute_key('objectClass'):
+                object_classes.extend(to_text(v) for v in values)
+
+        for object_class in object_classes:
+            oid = self.subschema.getoid(ldap.schema.ObjectClass, object_class)
+            if oid not in self.subschema.sed[ldap.schema.ObjectClass]:
+                errors.append("Unknown objectClass %s" % object_class)
+
+        if errors:
+            return errors
+
+        must, may = self.subschema.attribute_types(object_classes)
+        extensible = 'extensibleobject' in [o.lower() for o in object_classes]
+
+        present = set(self.attribute_key(n) for n, v in attrs.items() if v)
+        if current_attrs:
+            present.update(
+                self.attribute_key(n) for n, v in current_attrs.items() if v)
+
+        for name, values in attrs.items():
+            key = self.attribute_key(name)
+            attribute_type = self.subschema.get_obj(
+                ldap.schema.AttributeType, key)
+
+            if attribute_type is None:
+                errors.append("Unknown attribute %s" % name)
+                continue
+
+            if not extensible and key not in must and key not in may:
+                errors.append(
+                    "Attribute %s is not allowed by objectClass %s" % (
+                        name, ', '.join(object_classes)))
+
+            if attribute_type.single_value and len(values) > 1:
+                errors.append("Attribute %s is single-valued" % name)
+
+        for oid, attribute_type in must.items():
+            if oid not in present:
+                errors.append("Missing required attribute %s" % (
+                    attribute_type.names[0] if attribute_type.names else oid))
+
+        return errors
+
+    def validate_attribute(self, name, values):
+        """ Return the list of schema violations of a single attribute. """
+        if self.subschema is None:
+            return []
+
+        attribute_type = self.subschema.get_obj(
+            ldap.schema.AttributeType, self.attribute_key(name))
+
+        if attribute_type is None:
+            return ["Unknown attribute %s" % name]
+        elif attribute_type.single_value and len(values) > 1:
+            return ["Attribute %s is single-valued" % name]
+
+        return []
+
+    def _normalize_dn(self, value):
+        try:
+            rdns = ldap.dn.str2dn(value)
+        except Exception:
+            return value.lower()
+
+        return ldap.dn.dn2str([
+            [(self.attribute_key(attr), ' '.join(val.split()).lower(), flags)
+             for (attr, val, flags) in rdn]
+            for rdn in rdns])
+
+    def _normalize_oid(self, value):
+        value = value.strip()
+
+        if self.subschema is not None:
+            for se_class in [ldap.schema.ObjectClass, ldap.schema.AttributeType]:
+                oid = self.subschema.getoid(se_class, value)
+                if oid != value:
+                    return oid
+
+        return value.lower()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Helpers shared by the LDAP modules of the role to time the operations sent
+# to the server: a connection wrapper records the time of each connect, bind,
+# search, compare, add and modify, returned as percentiles in the result and
+# optionally traced one JSON line per operation in a file on the managed host.
+#
+# ldap.initialize does not open the connection: the TCP connection, and the
+# TLS handshake of a ldaps URI, are made by the first operation, usually the
+# bind, and are counted in its time. The connect time only covers
+# ldap.initialize and StartTLS.
+
+import json
+import sys
+import time
+
+from ansible.module_utils.six import string_types
+
+try:
+    import ldap
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+# Type of the operation of each timed method of the connection
+OPERATIONS = {
+    'start_tls_s': 'connect',
+    'simple_bind_s': 'bind',
+    'sasl_interactive_bind_s': 'bind',
+    'search_s': 'search',
+    'search_st': 'search',
+    'search_ext_s': 'search',
+    'search_subschemasubentry_s': 'search',
+    'read_subschemasubentry_s': 'search',
+    'read_s': 'search',
+    'compare_s': 'compare',
+    'compare_ext_s': 'compare',
+    'add_s': 'add',
+    'add_ext_s': 'add',
+    'modify_s': 'modify',
+    'modify_ext_s': 'modify',
+}
+
+# Asynchronous methods, timed from the request until its final result is read
+ASYNC_OPERATIONS = {
+    'search_ext': 'search',
+    'compare_ext': 'compare',
+    'add_ext': 'add',
+    'modify_ext': 'modify',
+}
+
+
+def percentile(values, percent):
+    """ Return the percentile of sorted values, with the nearest-rank method. """
+    if not values:
+        return 0
+
+    rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class LdapStats(object):
+    """ Timings of the LDAP operations of a module. """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.timings = {}
+        self._trace = None
+
+    def initialize(self, server_uri):
+        """ Open a connection to server_uri whose operations are timed. """
+        start = time.time()
+        try:
+            connection = ldap.initialize(server_uri)
+        except Exception:
+            self.record(
+                'connect', 'initialize', server_uri, start, sys.exc_info()[0].__name__)
+            raise
+
+        self.record('connect', 'initialize', server_uri, start)
+        return StatsConnection(connection, self)
+
+    def record(self, operation, method, target, start, error=None):
+        elapsed = (time.time() - start) * 1000
+        self.timings.setdefault(operation, []).append(elapsed)
+
+        if self.trace_file:
+            if self._trace is None:
+                self._trace = open(self.trace_file, 'a')
+
+            line = {
+                'time': round(start, 6), 'operation': operation,
+                'method': method, 'ms': round(elapsed, 3)}
+            if target is not None:
+                line['target'] = target
+            if error is not None:
+                line['error'] = error
+            self._trace.write(json.dumps(line, sort_keys=True) + '\n')
+            self._trace.flush()
+
+    def close(self):
+        """ Close the trace file, reopened by the next record. """
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def summary(self):
+        """ Return the count, total, p50, p95 and max milliseconds of each
+            operation type, and close the trace file. """
+        self.close()
+
+        result = {}
+        for (operation, timings) in self.timings.items():
+            timings = sorted(timings)
+            result[operation] = {
+                'count': len(timings),
+                'total': round(sum(timings), 3),
+                'p50': round(percentile(timings, 50), 3),
+                'p95': round(percentile(timings, 95), 3),
+                'max': round(timings[-1], 3),
+            }
+
+        return result
+
+
+class StatsConnection(object):
+    """ Wrap a LDAPObject and record the time of its operations. """
+
+    def __init__(self, connection, stats):
+        self.__dict__['_connection'] = connection
+        self.__dict__['_stats'] = stats
+        # Pending asynchronous operations, by message id
+        self.__dict__['_pending'] = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._connection, name)
+
+        if name in OPERATIONS:
+            return self._timed(OPERATIONS[name], name, attr)
+        elif name in ASYNC_OPERATIONS:
+            return self._sent(ASYNC_OPERATIONS[name], name, attr)
+        elif name in ('result', 'result2', 'result3', 'result4'):
+            return self._received(attr)
+
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    def _timed(self, operation, name, method):
+        stats = self._stats
+
+        def timed(*args, **kwargs):
+            target = args[0] if args and isinstance(args[0], string_types) else None
+            start = time.time()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                stats.record(operation, name, target, start, sys.exc_info()[0].__name__)
+                raise
+
+            stats.record(operation, name, target, start)
+            return result
+
+        return timed
+
+    def _sent(self, operation, name, method):
+        pending = self._pending
+
+        def sent(*args, **kwargs):
+            target = args[0] if args and isinstance(args[0], string_types) else None
+            start = time.time()
+            msgid = method(*args, **kwargs)
+            pending[msgid] = (operation, name, target, start)
+            return msgid
+
+        return sent
+
+    def _received(self, method):
+        pending = self._pending
+        stats = self._stats
+
+        def received(*args, **kwargs):
+            msgid = args[0] if args else kwargs.get('msgid')
+            try:
+                result = method(*args, **kwargs)
+            except ldap.TIMEOUT:
+                # The operation is still in progress
+                raise
+            except Exception:
+                if msgid in pending:
+                    (operation, name, target, start) = pending.pop(msgid)
+                    stats.record(operation, name, target, start, sys.exc_info()[0].__name__)
+                raise
+
+            # The entries of a search may be read one at a time: the
+            # operation is only complete with its final result
+            if not result or result[0] is None or (
+                    result[0] in (ldap.RES_SEARCH_ENTRY, ldap.RES_SEARCH_REFERENCE)):
+                return result
+
+            # The message id of the result is the third item, even when
+            # the results of any message were requested
+            if len(result) > 2:
+                msgid = result[2]
+            if msgid in pending:
+                (operation, name, target, start) = pending.pop(msgid)
+                stats.record(operation, name, target, start)
+
+            return result
+
+        return received
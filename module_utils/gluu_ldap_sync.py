@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# High-water mark of the last successful run of the LDAP modules, stored in a
+# local state file, to only look at the entries changed since then.
+
+import datetime
+import hashlib
+import json
+import os
+import time
+
+try:
+    import ldap
+    import ldap.filter
+
+    HAS_LDAP = True
+except ImportError:
+    HAS_LDAP = False
+
+
+SYNC_ATTRIBUTES = ['auto', 'modifyTimestamp', 'entryCSN']
+
+
+def entry_digest(attributes):
+    """ Return a digest of the desired attributes of an entry. """
+    serialized = json.dumps(attributes, sort_keys=True, default=str)
+
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def detect_sync_attribute(connection, base):
+    """ Use entryCSN when the server exposes a contextCSN on base. """
+    try:
+        results = connection.search_s(
+            base, ldap.SCOPE_BASE, '(objectClass=*)', attrlist=['contextCSN'])
+    except ldap.LDAPError:
+        return 'modifyTimestamp'
+
+    if results and results[0][1].get('contextCSN'):
+        return 'entryCSN'
+
+    return 'modifyTimestamp'
+
+
+class SyncState(object):
+    """ High-water mark and digests of the entries of the last successful run.
+
+    The mark saved at the end of a run is the time at which the run started,
+    minus margin seconds to absorb clock skew and replication delays, so an
+    entry changed while the run was in progress is seen again by the next one.
+    Deleted entries are never reported by the mark filter.
+
+    The dns changed under a base since the mark are searched once and kept in
+    the state file for margin seconds, to be reused by the next calls of the
+    same run, like the items of a loop: the mark they save is older than that
+    search, so the entries changed since are seen by the next run.
+
+    When journal_dns is set, from the journal of the gluu-ldap-watcher
+    daemon, the entries changed on the server are the ones it lists instead.
+    """
+    def __init__(self, path, key, attribute, margin=300):
+        self.path = os.path.expanduser(path)
+        self.key = key
+        self.attribute = attribute
+        self.margin = margin
+
+        self.data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+            except (IOError, ValueError):
+                self.data = {}
+
+        state = self.data.get(key, {})
+        self.mark = None
+        self.entries = {}
+        if state.get('attribute') == attribute:
+            self.mark = state.get('mark')
+            self.entries = state.get('entries', {})
+
+        self.start_mark = self._format_mark(time.time() - margin)
+        self.journal_dns = None
+
+    def changed_filter(self, search_filter=None):
+        """ Restrict search_filter to the entries changed since the mark. """
+        if self.mark is None:
+            return search_filter
+
+        mark_filter = '(%s>=%s)' % (
+            self.attribute, ldap.filter.escape_filter_chars(self.mark))
+
+        if not search_filter:
+            return mark_filter
+
+        if not search_filter.startswith('('):
+            search_filter = '(%s)' % search_filter
+
+        return '(&%s%s)' % (search_filter, mark_filter)
+
+    def cached_changes(self, server_uri, base):
+        """ Return the lowercased dns changed under base since the mark, from
+            a search made earlier in this run, or None if there is none. """
+        changes = self.data.get('changes', {}).get(
+            '|'.join([server_uri, base, self.attribute]))
+        if not changes or self.mark is None:
+            return None
+
+        # Compare the date part, common to modifyTimestamp and entryCSN
+        if changes['mark'][:14] > self.mark[:14]:
+            return None
+        if time.time() - changes['time'] >= self.margin:
+            return None
+
+        return set(changes['dns'])
+
+    def cache_changes(self, server_uri, base, dns):
+        """ Keep the dns changed under base since the mark for this run. """
+        self.data.setdefault('changes', {})[
+            '|'.join([server_uri, base, self.attribute])] = {
+                'mark': self.mark,
+                'time': time.time(),
+                'dns': sorted(dns),
+            }
+
+    def is_known(self, dn, digest):
+        """ True if dn had the same desired attributes at the last run. """
+        return self.entries.get(dn.lower()) == digest
+
+    def remember(self, dn, digest):
+        self.entries[dn.lower()] = digest
+
+    def save(self):
+        """ Save the start of this run as the mark of the next one. """
+        self.data[self.key] = {
+            'attribute': self.attribute,
+            'mark': self.start_mark,
+            'entries': self.entries,
+        }
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def _format_mark(self, timestamp):
+        mark = datetime.datetime.utcfromtimestamp(timestamp)
+
+        if self.attribute == 'entryCSN':
+            return mark.strftime('%Y%m%d%H%M%S.000000Z#000000#000#000000')
+
+        return mark.strftime('%Y%m%d%H%M%SZ')
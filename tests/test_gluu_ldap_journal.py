@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Guillaume Smaha <guillaume.smaha@gmail.com>
+#
+# Read and consume offsets of the journal written by the gluu-ldap-watcher
+# daemon. Run with: python -m unittest discover tests
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'module_utils'))
+
+from gluu_ldap_journal import Journal  # noqa: E402
+
+
+def record(change, dn=None):
+    line = {'time': '2017-01-01T00:00:00Z', 'change': change}
+    if dn is not None:
+        line['dn'] = dn
+    return (json.dumps(line, sort_keys=True) + '\n').encode('utf-8')
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'ldap-journal.jsonl')
+        self.journal = Journal(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content, mode='wb'):
+        with open(self.path, mode) as f:
+            f.write(content)
+
+    def content(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_read_missing(self):
+        self.assertEqual(self.journal.read(), ([], 0))
+        self.assertFalse(self.journal.consume(10))
+
+    def test_read_complete_lines(self):
+        lines = record('add', 'o=a') + record('delete', 'o=b')
+        self.write(lines)
+
+        (records, offset) = self.journal.read()
+        self.assertEqual([r['dn'] for r in records], ['o=a', 'o=b'])
+        self.assertEqual(offset, len(lines))
+
+    def test_read_ignores_line_being_written(self):
+        complete = record('add', 'o=a')
+        self.write(complete + record('modify', 'o=b')[:-5])
+
+        (records, offset) = self.journal.read()
+        self.assertEqual([r['dn'] for r in records], ['o=a'])
+        self.assertEqual(offset, len(complete))
+
+    def test_read_skips_invalid_lines(self):
+        lines = b'\n' + b'{not json\n' + record('resync')
+        self.write(lines)
+
+        (records, offset) = self.journal.read()
+        self.assertEqual([r['change'] for r in records], ['resync'])
+        self.assertEqual(offset, len(lines))
+
+    def test_consume_keeps_appended_records(self):
+        self.write(record('add', 'o=a'))
+        (_, offset) = self.journal.read()
+
+        # Appended by the watcher after the read
+        appended = record('modify', 'o=b') + record('delete', 'o=c')[:-5]
+        self.write(appended, 'ab')
+
+        self.assertTrue(self.journal.consume(offset))
+        self.assertEqual(self.content(), appended)
+        self.assertFalse([n for n in os.listdir(self.directory) if n.endswith('.tmp')])
+
+        # The records appended after the consumed offset are read next
+        (records, offset) = self.journal.read()
+        self.assertEqual([r['dn'] for r in records], ['o=b'])
+        self.assertEqual(offset, len(record('modify', 'o=b')))
+
+    def test_consume_nothing(self):
+        lines = record('add', 'o=a')
+        self.write(lines)
+
+        self.assertFalse(self.journal.consume(0))
+        self.assertEqual(self.content(), lines)
+
+
+if __name__ == '__main__':
+    unittest.main()